@@ -0,0 +1,13 @@
+#!/bin/bash
+#SBATCH --cpus-per-task=10
+#SBATCH --ntasks=1
+#SBATCH --mem=30720
+
+# Activate virtual env
+source ./venv/bin/activate
+
+# One run of 10 islands, on the cores of the 10 independent runs of batch.sh
+python main.py islands --islands 10 --topology ring
+
+# Deactivate virtual env
+deactivate
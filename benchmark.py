@@ -0,0 +1,281 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import time
+import numpy as np
+import rasterio
+from rasterio.transform import from_origin
+from shapely import Polygon, contains_xy
+import data
+
+# Benchmarks the hot paths on synthetic data, so it runs without the real raster
+# and locations, and writes the timings to a JSON baseline to compare commits.
+# python benchmark.py --output ./results/benchmark.json --compare ./results/benchmark_old.json
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--locations", type=int, default=5237, help="Candidate locations")
+parser.add_argument(
+    "--raster-size",
+    type=int,
+    default=1000,
+    help="Width and height of the synthetic raster in pixels",
+)
+parser.add_argument(
+    "--pixel-size",
+    type=float,
+    default=0.0008333333,
+    help="Pixel size in degrees, ~100 m like the population raster",
+)
+parser.add_argument("--population", type=int, default=100, help="GA population size")
+parser.add_argument("--repeat", type=int, default=5, help="Timed runs of each benchmark")
+parser.add_argument("--seed", type=int, default=0)
+parser.add_argument("--workdir", default="./data/benchmark", help="Directory of the synthetic data")
+parser.add_argument("--output", default="./results/benchmark.json", help="JSON baseline written")
+parser.add_argument("--compare", default=None, help="JSON baseline to compare with")
+
+# Origin of the synthetic raster, near Valencia so distances are realistic
+origin = (-0.5, 39.6)
+
+
+def create_region(rng, size, pixel_size):
+    """
+    Returns an irregular star-shaped polygon inside the raster extent
+    """
+    center_x = origin[0] + size * pixel_size / 2
+    center_y = origin[1] - size * pixel_size / 2
+    angles = np.linspace(0, 2 * np.pi, 64, endpoint=False)
+    radii = size * pixel_size / 2 * rng.uniform(0.6, 0.95, len(angles))
+    return Polygon(
+        np.column_stack((center_x + radii * np.cos(angles), center_y + radii * np.sin(angles)))
+    )
+
+
+def create_raster(rng, path, size, pixel_size):
+    """
+    Writes an int32 GeoTIFF with a few dense population centres, noise and NoData pixels
+    """
+    rows, cols = np.mgrid[0:size, 0:size]
+    density = np.zeros((size, size))
+    for _ in range(8):
+        row, col = rng.uniform(0, size, 2)
+        spread = rng.uniform(0.03, 0.15) * size
+        density += rng.uniform(20, 200) * np.exp(
+            -((rows - row) ** 2 + (cols - col) ** 2) / (2 * spread**2)
+        )
+    population = rng.poisson(density).astype(np.int32)
+    population[rng.random((size, size)) < 0.01] = -99999
+
+    with rasterio.open(
+        path,
+        "w",
+        driver="GTiff",
+        width=size,
+        height=size,
+        count=1,
+        dtype="int32",
+        crs="EPSG:4326",
+        transform=from_origin(origin[0], origin[1], pixel_size, pixel_size),
+        nodata=-99999,
+        tiled=True,
+        compress="deflate",
+    ) as raster:
+        raster.write(population, 1)
+
+
+def create_locations(rng, region, n):
+    """
+    Returns n random [lon, lat] locations inside the region
+    """
+    min_x, min_y, max_x, max_y = region.bounds
+    locations = np.empty((0, 2))
+    while len(locations) < n:
+        points = rng.uniform((min_x, min_y), (max_x, max_y), (2 * n, 2))
+        locations = np.vstack((locations, points[contains_xy(region, points[:, 0], points[:, 1])]))
+    return locations[:n].tolist()
+
+
+def use_synthetic_data(
+    workdir=parser.get_default("workdir"),
+    seed=parser.get_default("seed"),
+    raster_size=parser.get_default("raster_size"),
+    pixel_size=parser.get_default("pixel_size"),
+    locations=parser.get_default("locations"),
+):
+    """
+    Writes the synthetic raster to workdir and replaces the input data with it, see
+    data.set_input_data. Modules reading the input data must be imported afterwards.
+
+    :param str workdir: Directory of the synthetic data
+    :param int seed: Seed of the synthetic data
+    :param int raster_size: Width and height of the raster in pixels
+    :param float pixel_size: Pixel size in degrees
+    :param int locations: Candidate locations
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(workdir, exist_ok=True)
+    raster_path = f"{workdir}/population.tif"
+    region = create_region(rng, raster_size, pixel_size)
+    create_raster(rng, raster_path, raster_size, pixel_size)
+    data.set_input_data(
+        raster_file=raster_path,
+        valencia_region_polygon=region,
+        possible_locations=create_locations(rng, region, locations),
+        individual_size=locations,
+        current_locations=[],
+        heuristic_individual=[0] * locations,
+    )
+
+
+def measure(func, repeat):
+    """
+    Returns the seconds taken by each of repeat calls of func
+    """
+    timings = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start_time)
+    return timings
+
+
+def summarize(timings):
+    return {
+        "min": min(timings),
+        "median": statistics.median(timings),
+        "mean": statistics.mean(timings),
+        "runs": len(timings),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+
+    # --- Synthetic data ---
+    use_synthetic_data(args.workdir, args.seed, args.raster_size, args.pixel_size, args.locations)
+    raster_path = data.raster_file
+    region = data.valencia_region_polygon
+    locations = data.possible_locations
+
+    # Imported once the synthetic data is in place
+    import random
+    import population_calculator
+    from deap import base, creator, tools
+    import bitmatrix
+    from custom_deap import eaSimple, varAnd
+    from ga_functions import (
+        eval_fitness,
+        eval_fitness_raster,
+        load_evaluator,
+        feasible,
+        create_individual_random,
+        mut_swap,
+        cx_cardinality,
+        get_raster_context,
+    )
+    from utils import get_solution_coords, voronoi_division, voronoi_cells, cells_to_ragged_arrays
+
+    random.seed(args.seed)
+    bitmatrix.seed(args.seed)
+    creator.create("FitnessMin", base.Fitness, weights=(-1.0,))
+    creator.create("Individual", list, fitness=creator.FitnessMin)
+
+    population = [create_individual_random() for _ in range(args.population)]
+    solution = population[0]
+    solution_coords = get_solution_coords(solution, locations)
+    division = voronoi_division(solution_coords, region)
+    cells = voronoi_cells(solution_coords, region)
+
+    # Raster and pixels loaded outside the timings
+    load_evaluator("voronoi")
+    load_evaluator("raster")
+    context = get_raster_context()
+
+    toolbox = base.Toolbox()
+    toolbox.register("population", tools.initRepeat, list, create_individual_random)
+    toolbox.register("evaluate", eval_fitness)
+    toolbox.decorate("evaluate", tools.DeltaPenality(feasible, 900000))
+    toolbox.register("mate", tools.cxUniform, indpb=0.5)
+    toolbox.register("mutate", tools.mutFlipBit, indpb=0.17)
+    toolbox.register("select", tools.selTournament, tournsize=4)
+
+    swap_toolbox = base.Toolbox()
+    swap_toolbox.register("mate", cx_cardinality)
+    swap_toolbox.register("mutate", mut_swap, indpb=0.17)
+
+    for ind in population:
+        ind.fitness.values = (random.random(),)
+    bit_population = bitmatrix.BitPopulation.from_individuals(population)
+
+    def ga_generation():
+        # Time of generation 1 only, from the logbook
+        _, logbook = eaSimple(
+            toolbox.population(n=args.population), toolbox, 0.8, 0.18, 1, verbose=False
+        )
+        return logbook[-1]["time"]
+
+    benchmarks = {
+        "eval_fitness": lambda: eval_fitness(solution),
+        "eval_fitness_raster": lambda: eval_fitness_raster(solution),
+        "voronoi_division": lambda: voronoi_division(solution_coords, region),
+        "calculate_population": lambda: [
+            population_calculator.calculate_population(cell, raster_path) for cell in division[:20]
+        ],
+        "context.calculate_population": lambda: [
+            context.calculate_population(cell) for cell in division
+        ],
+        "context.calculate_populations": lambda: context.calculate_populations(
+            *cells_to_ragged_arrays(cells)
+        ),
+        "varAnd_flip": lambda: varAnd(population, toolbox, 0.8, 0.18),
+        "varAnd_swap": lambda: varAnd(population, swap_toolbox, 0.8, 0.18),
+        "bitmatrix.var_and": lambda: bitmatrix.var_and(bit_population, 0.8, 0.18, 0.5, 0.17),
+    }
+
+    results = {}
+    for name, func in benchmarks.items():
+        func()  # Warm up
+        results[name] = summarize(measure(func, args.repeat))
+        print(f"{name}: {results[name]['median'] * 1000:.2f} ms")
+    results["eaSimple_generation"] = summarize([ga_generation() for _ in range(args.repeat)])
+    print(f"eaSimple_generation: {results['eaSimple_generation']['median'] * 1000:.2f} ms")
+
+    baseline = {
+        "commit": git_commit(),
+        "machine": {
+            "platform": platform.platform(),
+            "processor": platform.processor(),
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+        },
+        "config": {
+            key: getattr(args, key)
+            for key in ("locations", "raster_size", "pixel_size", "population", "repeat", "seed")
+        },
+        "cells": len(division),
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(baseline, f, indent=1)
+
+    if args.compare is not None:
+        with open(args.compare) as f:
+            previous = json.load(f)
+        if previous["config"] != baseline["config"]:
+            print("Warning: the baselines were run with different configurations")
+        print(f"Compared with {previous['commit']}, median speedup:")
+        for name, result in results.items():
+            if name in previous["results"]:
+                print(f"  {name}: {previous['results'][name]['median'] / result['median']:.2f}x")
@@ -0,0 +1,51 @@
+import os
+import random
+import time
+import data
+
+# The synthetic data of benchmark.py when the population raster is missing
+if not os.path.exists(data.raster_file):
+    from benchmark import use_synthetic_data
+
+    print(f"{data.raster_file} missing, using the synthetic data of benchmark.py")
+    use_synthetic_data()
+
+import population_calculator
+from data import possible_locations, valencia_region_polygon, heuristic_individual, raster_file
+from ga_functions import max_containers
+from utils import get_solution_coords, voronoi_division
+
+# Real Voronoi cells of the heuristic solution, or of a random one on the synthetic data
+solution = heuristic_individual
+if not any(solution):
+    solution = [0] * len(possible_locations)
+    for i in random.Random(0).sample(range(len(possible_locations)), max_containers):
+        solution[i] = 1
+solution_coords = get_solution_coords(solution, possible_locations)
+division = voronoi_division(solution_coords, valencia_region_polygon)
+
+# Warm the block cache so both methods read the same cached pixels
+context = population_calculator.RasterContext(raster_file)
+for polygon in division:
+    context.calculate_population(polygon, method="contains")
+
+timings = {}
+populations = {}
+for method in ("contains", "scanline"):
+    start_time = time.perf_counter()
+    populations[method] = [
+        context.calculate_population(polygon, method=method) for polygon in division
+    ]
+    timings[method] = time.perf_counter() - start_time
+
+mismatches = sum(
+    a != b for a, b in zip(populations["contains"], populations["scanline"])
+)
+
+print(f"Cells: {len(division)}")
+for method in timings:
+    print(
+        f"{method}: {timings[method]:.4f}s, population {sum(populations[method])}"
+    )
+print(f"Speedup: {timings['contains'] / timings['scanline']:.1f}x")
+print(f"Mismatching cells: {mismatches}")
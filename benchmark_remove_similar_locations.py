@@ -0,0 +1,52 @@
+import json
+import os
+import sys
+import time
+from utils import remove_similar_locations, get_distance_between_points
+
+# Locations compared with the pairwise implementation, which is O(n^2)
+n_reference = int(sys.argv[1]) if len(sys.argv) > 1 else 3000
+
+input_file = "./data/contenidors-residus-solids-contenidores-residuos-solidos.json"
+if not os.path.exists(input_file):
+    input_file = "./data/contenidors-oli-usat-contenedores-aceite-usado.json"
+with open(input_file) as f:
+    containers = json.load(f)
+locations = [
+    [container["geo_point_2d"]["lon"], container["geo_point_2d"]["lat"]]
+    for container in containers
+]
+
+
+def remove_similar_locations_pairwise(locations, threshold=10):
+    # Previous implementation, comparing every location with all the kept ones
+    unique_locations = []
+    for loc in locations:
+        if all(
+            get_distance_between_points(loc, unique_loc) > threshold
+            for unique_loc in unique_locations
+        ):
+            unique_locations.append(loc)
+    return unique_locations
+
+
+start_time = time.perf_counter()
+unique_locations = remove_similar_locations(locations)
+grid_time = time.perf_counter() - start_time
+print(f"{input_file}: {len(locations)} locations, {len(unique_locations)} kept")
+print(f"grid: {grid_time:.3f}s")
+
+subset = locations[:n_reference]
+start_time = time.perf_counter()
+reference = remove_similar_locations_pairwise(subset)
+pairwise_time = time.perf_counter() - start_time
+
+start_time = time.perf_counter()
+result = remove_similar_locations(subset)
+subset_time = time.perf_counter() - start_time
+
+print(
+    f"First {len(subset)} locations: pairwise {pairwise_time:.3f}s, grid {subset_time:.3f}s, "
+    f"speedup {pairwise_time / subset_time:.1f}x"
+)
+print(f"Identical output: {result == reference}")
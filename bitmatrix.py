@@ -0,0 +1,364 @@
+import math
+import numpy as np
+
+# Random generator of the vectorized operators
+rng = np.random.default_rng()
+
+
+def seed(value):
+    global rng
+    rng = np.random.default_rng(value)
+
+
+class BitFitness:
+    """
+    Fitness of one row of a :class:`BitPopulation`, with the interface of a
+    single objective DEAP fitness. Invalid fitnesses are stored as NaN.
+    """
+
+    def __init__(self, population, row):
+        self.population = population
+        self.row = row
+
+    @property
+    def weights(self):
+        return self.population.weights
+
+    @property
+    def values(self):
+        value = self.population.fitness[self.row]
+        return () if math.isnan(value) else (float(value),)
+
+    @values.setter
+    def values(self, values):
+        self.population.fitness[self.row] = values[0]
+
+    @values.deleter
+    def values(self):
+        self.population.fitness[self.row] = np.nan
+
+    @property
+    def valid(self):
+        return not math.isnan(self.population.fitness[self.row])
+
+
+class BitIndividual:
+    """
+    View of one row of a :class:`BitPopulation`. It behaves like a list of
+    0s and 1s for the evaluation functions: indexing, len, count and
+    conversion to a NumPy array.
+    """
+
+    def __init__(self, population, row):
+        self.population = population
+        self.row = row
+        self.fitness = BitFitness(population, row)
+
+    def __array__(self, dtype=None, copy=None):
+        genes = np.unpackbits(self.population.bits[self.row], count=self.population.size)
+        return genes if dtype is None else genes.astype(dtype)
+
+    def __len__(self):
+        return self.population.size
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.population.size
+        return int(self.population.bits[self.row, index >> 3] >> (7 - (index & 7)) & 1)
+
+    def __iter__(self):
+        return iter(np.asarray(self).tolist())
+
+    def count(self, value):
+        ones = int(np.bitwise_count(self.population.bits[self.row]).sum())
+        return ones if value == 1 else self.population.size - ones
+
+
+class BitPopulation:
+    """
+    Population of binary individuals stored as a packed bit matrix, one row
+    per individual and 8 genes per byte, with a fitness array.
+
+    It can be used in place of a list of individuals in
+    :func:`custom_deap.eaSimple`, registering :func:`random_population`,
+    :func:`sel_tournament` and :func:`var_and` in the toolbox and using a
+    :class:`BitHallOfFame`. Iterating yields :class:`BitIndividual` views.
+
+    :param ndarray bits: Packed genes, shape (individuals, ceil(size / 8))
+    :param int size: Number of genes per individual
+    :param tuple weights: Fitness weights, as in the DEAP fitness class
+    :param ndarray fitness: Fitness of each individual, NaN when invalid
+    """
+
+    def __init__(self, bits, size, weights=(-1.0,), fitness=None):
+        self.bits = bits
+        self.size = size
+        self.weights = weights
+        if fitness is None:
+            fitness = np.full(len(bits), np.nan)
+        self.fitness = fitness
+
+    @classmethod
+    def from_individuals(cls, individuals, weights=(-1.0,)):
+        genes = np.asarray([np.asarray(ind, dtype=bool) for ind in individuals])
+        population = cls(np.packbits(genes, axis=1), genes.shape[1], weights)
+        for i, ind in enumerate(individuals):
+            fitness = getattr(ind, "fitness", None)
+            if fitness is not None and fitness.valid:
+                population.fitness[i] = fitness.values[0]
+        return population
+
+    def __len__(self):
+        return len(self.bits)
+
+    def __getitem__(self, row):
+        return BitIndividual(self, row)
+
+    def __iter__(self):
+        return (BitIndividual(self, row) for row in range(len(self)))
+
+    def __setitem__(self, key, population):
+        # Only whole replacement, population[:] = offspring
+        if key != slice(None):
+            raise TypeError("BitPopulation only supports population[:] = offspring")
+        self.bits = population.bits
+        self.fitness = population.fitness
+
+    def take(self, rows):
+        return BitPopulation(
+            self.bits[rows], self.size, self.weights, self.fitness[rows]
+        )
+
+    def copy(self):
+        return BitPopulation(
+            self.bits.copy(), self.size, self.weights, self.fitness.copy()
+        )
+
+    def genes(self):
+        """
+        Returns the unpacked genes as a boolean matrix
+        """
+        return np.unpackbits(self.bits, axis=1, count=self.size).astype(bool)
+
+    def count_ones(self):
+        """
+        Returns the number of genes set to 1 of every individual
+        """
+        return np.bitwise_count(self.bits).sum(axis=1)
+
+    def weighted_fitness(self):
+        return self.fitness * self.weights[0]
+
+
+def random_bits(rows, size, probability):
+    """
+    Returns a packed matrix with each bit set independently with the given probability
+    """
+    return np.packbits(rng.random((rows, size)) < probability, axis=1)
+
+
+def random_population(n, size, ones, weights=(-1.0,)):
+    """
+    Returns n individuals with exactly `ones` genes set at random positions,
+    like ga_functions.create_individual_random
+
+    :param int n: Number of individuals
+    :param int size: Number of genes
+    :param int ones: Genes set to 1 in every individual
+    :param tuple weights: Fitness weights
+    """
+    positions = np.argpartition(rng.random((n, size)), ones, axis=1)[:, :ones]
+    genes = np.zeros((n, size), dtype=bool)
+    np.put_along_axis(genes, positions, True, axis=1)
+    return BitPopulation(np.packbits(genes, axis=1), size, weights)
+
+
+def sel_tournament(population, k, tournsize):
+    """
+    Vectorized :func:`deap.tools.selTournament`: the best of tournsize random
+    individuals, k times. Returns a new population.
+    """
+    aspirants = rng.integers(0, len(population), size=(k, tournsize))
+    fitness = population.weighted_fitness()[aspirants]
+    winners = aspirants[np.arange(k), np.argmax(fitness, axis=1)]
+    return population.take(winners)
+
+
+def cx_uniform(first, second, indpb):
+    """
+    Vectorized :func:`deap.tools.cxUniform` of the rows of two packed
+    matrices, swapping each gene with probability indpb. Returns the children.
+    """
+    swap = random_bits(len(first), second.shape[1] * 8, indpb)
+    diff = (first ^ second) & swap
+    return first ^ diff, second ^ diff
+
+
+def mut_flip_bit(bits, size, indpb):
+    """
+    Vectorized :func:`deap.tools.mutFlipBit` of the rows of a packed matrix,
+    flipping each of the size genes with probability indpb
+    """
+    return bits ^ random_bits(len(bits), size, indpb)
+
+
+def random_subset(mask, counts):
+    """
+    Returns a boolean matrix with counts[i] True values of row i of mask,
+    chosen uniformly at random
+
+    :param ndarray mask: Boolean matrix of the candidate genes
+    :param ndarray counts: Number of genes chosen in each row
+    """
+    keys = np.where(mask, rng.random(mask.shape), np.inf)
+    order = np.argsort(keys, axis=1)
+    chosen = np.zeros_like(mask)
+    ranks = np.arange(mask.shape[1])[np.newaxis, :] < np.asarray(counts)[:, np.newaxis]
+    np.put_along_axis(chosen, order, ranks, axis=1)
+    return chosen
+
+
+def cx_cardinality(first, second, size):
+    """
+    Vectorized :func:`ga_functions.cx_cardinality` of the rows of two packed
+    matrices: each child keeps the number of genes set to 1 of its parent.
+    Returns the children.
+    """
+    genes1 = np.unpackbits(first, axis=1, count=size).astype(bool)
+    genes2 = np.unpackbits(second, axis=1, count=size).astype(bool)
+    common = genes1 & genes2
+    differ = genes1 ^ genes2
+    chosen = random_subset(differ, (genes1 & differ).sum(axis=1))
+    return (
+        np.packbits(common | chosen, axis=1),
+        np.packbits(common | (differ & ~chosen), axis=1),
+    )
+
+
+def mut_swap(bits, size, indpb):
+    """
+    Vectorized :func:`ga_functions.mut_swap` of the rows of a packed matrix,
+    moving each gene set to 1 to a gene set to 0 with probability indpb
+    """
+    genes = np.unpackbits(bits, axis=1, count=size).astype(bool)
+    moved = genes & (rng.random(genes.shape) < indpb)
+    counts = np.minimum(moved.sum(axis=1), size - genes.sum(axis=1))
+    moved &= random_subset(moved, counts)
+    targets = random_subset(~genes, counts)
+    return np.packbits((genes & ~moved) | targets, axis=1)
+
+
+def repair(bits, size, max_ones):
+    """
+    Vectorized :func:`ga_functions.repair` of the rows of a packed matrix,
+    clearing random genes of the rows with more than max_ones genes set to 1
+    """
+    over = np.flatnonzero(np.bitwise_count(bits).sum(axis=1) > max_ones)
+    if len(over) == 0:
+        return bits
+    repaired = bits.copy()
+    genes = np.unpackbits(bits[over], axis=1, count=size).astype(bool)
+    cleared = random_subset(genes, genes.sum(axis=1) - max_ones)
+    repaired[over] = np.packbits(genes & ~cleared, axis=1)
+    return repaired
+
+
+def var_and(
+    population,
+    cxpb,
+    mutpb,
+    indpb_mate,
+    indpb_mutate,
+    operators="flip",
+    max_ones=None,
+):
+    """
+    Vectorized :func:`custom_deap.varAnd`. Consecutive pairs are mated with
+    probability cxpb and every individual is mutated with probability mutpb.
+    Only the offspring whose genes changed have their fitness invalidated.
+
+    :param str operators: "flip" for uniform crossover and bit flip mutation,
+                          "swap" for the cardinality preserving crossover and
+                          swap mutation (indpb_mate is not used)
+    :param int max_ones: When given, offspring with more genes set to 1 are repaired
+    """
+    offspring = population.copy()
+    bits = offspring.bits
+    pairs = len(offspring) // 2
+
+    # Crossover of individuals 2i and 2i+1
+    mated = np.flatnonzero(rng.random(pairs) < cxpb)
+    first, second = 2 * mated, 2 * mated + 1
+    if operators == "swap":
+        children = cx_cardinality(bits[first], bits[second], offspring.size)
+    else:
+        children = cx_uniform(bits[first], bits[second], indpb_mate)
+    bits[first], bits[second] = children
+
+    # Mutation
+    mutated = np.flatnonzero(rng.random(len(offspring)) < mutpb)
+    if operators == "swap":
+        bits[mutated] = mut_swap(bits[mutated], offspring.size, indpb_mutate)
+    else:
+        bits[mutated] = mut_flip_bit(bits[mutated], offspring.size, indpb_mutate)
+
+    if max_ones is not None:
+        bits[:] = repair(bits, offspring.size, max_ones)
+
+    changed = (bits != population.bits).any(axis=1)
+    offspring.fitness[changed] = np.nan
+    return offspring
+
+
+class BitHallOfFame:
+    """
+    :class:`deap.tools.HallOfFame` for a :class:`BitPopulation`. Its items
+    are unpacked into individual_class instances with their fitness.
+
+    :param int maxsize: Number of individuals kept
+    :param individual_class: Class of the items, e.g. creator.Individual
+    """
+
+    def __init__(self, maxsize, individual_class):
+        self.maxsize = maxsize
+        self.individual_class = individual_class
+        self.items = []
+        self.keys = []
+
+    def update(self, population):
+        order = np.argsort(-population.weighted_fitness(), kind="stable")
+        # Duplicates are skipped, so rows past the first maxsize may still enter
+        for row in order:
+            if math.isnan(population.fitness[row]):
+                continue
+
+            weighted = population.fitness[row] * population.weights[0]
+            position = len(self.items)
+            while (
+                position > 0
+                and self.items[position - 1].fitness.values[0] * population.weights[0]
+                < weighted
+            ):
+                position -= 1
+            if position >= self.maxsize:
+                # The next rows are not better either
+                break
+
+            key = population.bits[row].tobytes()
+            if key in self.keys:
+                continue
+
+            individual = self.individual_class(np.asarray(population[row]).tolist())
+            individual.fitness.values = (float(population.fitness[row]),)
+            self.items.insert(position, individual)
+            self.keys.insert(position, key)
+            del self.items[self.maxsize :], self.keys[self.maxsize :]
+
+    def __getitem__(self, i):
+        return self.items[i]
+
+    def __len__(self):
+        return len(self.items)
+
+    def __iter__(self):
+        return iter(self.items)
@@ -0,0 +1,97 @@
+import os
+import random
+import sys
+import data
+
+# The synthetic data of benchmark.py when the population raster is missing
+if not os.path.exists(data.raster_file):
+    from benchmark import use_synthetic_data
+
+    print(f"{data.raster_file} missing, using the synthetic data of benchmark.py")
+    use_synthetic_data()
+
+from data import possible_locations, individual_size, current_locations, heuristic_individual
+import numpy as np
+from ga_functions import eval_fitness, eval_fitness_raster, max_containers, get_region_pixels
+from incremental import IncrementalEvaluator
+from utils import nearest_site_populations
+
+# Number of random individuals to compare
+n_random = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+
+
+def random_solution():
+    solution = [0] * individual_size
+    for i in random.sample(range(individual_size), max_containers):
+        solution[i] = 1
+    return solution
+
+
+def incremental_matches(evaluator, solution):
+    """
+    Checks the fitness and, as it only depends on the population of the sites
+    above the service level, the population of every site
+    """
+    sites = np.flatnonzero(solution)
+    populations = (
+        nearest_site_populations(*get_region_pixels(), evaluator.locations[sites])
+        if len(sites)
+        else np.empty(0)
+    )
+    return evaluator.fitness()[0] == eval_fitness_raster(solution)[0] and np.array_equal(
+        evaluator.site_population[sites], populations
+    )
+
+
+cases = []
+# Not part of the synthetic data
+if any(heuristic_individual):
+    cases.append(("heuristic", heuristic_individual, possible_locations))
+if current_locations:
+    cases.append(("current", [1] * len(current_locations), current_locations))
+for i in range(n_random):
+    cases.append((f"random_{i}", random_solution(), possible_locations))
+
+mismatches = 0
+for name, solution, locations in cases:
+    voronoi = eval_fitness(solution, locations)[0]
+    raster = eval_fitness_raster(solution, locations)[0]
+    if voronoi != raster:
+        mismatches += 1
+    print(f"{name}: voronoi={voronoi} raster={raster} diff={raster - voronoi}")
+
+print(f"{mismatches}/{len(cases)} mismatches")
+
+# Incremental evaluation after single additions and removals
+solution = random_solution()
+evaluator = IncrementalEvaluator(solution)
+incremental_mismatches = 0
+for step in range(n_random):
+    index = random.randrange(individual_size)
+    evaluator.flip(index)
+    solution[index] = 1 - solution[index]
+
+    match = incremental_matches(evaluator, solution)
+    if not match:
+        incremental_mismatches += 1
+    print(f"flip {index}: incremental={evaluator.fitness()[0]} match={match}")
+
+# Several genes at once, as produced by a mutation
+mutated = list(solution)
+for index in random.sample(range(individual_size), 30):
+    mutated[index] = 1 - mutated[index]
+evaluator.apply(mutated)
+if not incremental_matches(evaluator, mutated):
+    incremental_mismatches += 1
+
+# Down to no locations and back
+empty = IncrementalEvaluator([0] * individual_size)
+for index in random.sample(range(individual_size), 5):
+    empty.add(index)
+for index in list(empty.active.nonzero()[0]):
+    empty.remove(index)
+empty.add(index)
+if not incremental_matches(empty, empty.solution()):
+    incremental_mismatches += 1
+
+print(f"{incremental_mismatches}/{n_random + 2} incremental mismatches")
@@ -0,0 +1,228 @@
+import json
+import os
+import random
+import time
+import numpy as np
+from deap import tools
+import bitmatrix
+from bitmatrix import BitPopulation, BitHallOfFame
+
+
+def pack_population(population):
+    """
+    Returns the genes of the individuals packed 8 per byte, one row each, and
+    their fitness values, NaN when invalid
+    """
+    if isinstance(population, BitPopulation):
+        return population.bits, population.fitness[:, np.newaxis]
+    genes = np.packbits(np.asarray([np.asarray(ind, dtype=np.uint8) for ind in population]), axis=1)
+    nobj = len(population[0].fitness.weights)
+    fitness = np.array(
+        [ind.fitness.values if ind.fitness.valid else (np.nan,) * nobj for ind in population],
+        dtype=np.float64,
+    ).reshape(len(population), nobj)
+    return genes, fitness
+
+
+def unpack_individuals(genes, fitness, size, individual_class, approximate=None):
+    individuals = []
+    for k, (row, values) in enumerate(zip(genes, fitness)):
+        individual = individual_class(np.unpackbits(row, count=size).tolist())
+        if not np.isnan(values).any():
+            individual.fitness.values = tuple(float(value) for value in values)
+        if approximate is not None and approximate[k]:
+            individual.approximate = True
+        individuals.append(individual)
+    return individuals
+
+
+def approximate_flags(population):
+    """
+    Returns which individuals have a fitness predicted by a surrogate, see surrogate.py
+    """
+    if isinstance(population, BitPopulation):
+        return np.zeros(len(population), dtype=bool)
+    return np.array([getattr(ind, "approximate", False) for ind in population], dtype=bool)
+
+
+def to_json(value):
+    """
+    JSON encoding of the numpy values of the logbook records, keeping their type
+    """
+    if isinstance(value, np.ndarray):
+        return {"ndarray": value.tolist(), "dtype": value.dtype.str}
+    if isinstance(value, np.generic):
+        return {"scalar": value.item(), "dtype": value.dtype.str}
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def from_json(value):
+    if isinstance(value, dict) and set(value) == {"ndarray", "dtype"}:
+        return np.array(value["ndarray"], dtype=value["dtype"])
+    if isinstance(value, dict) and set(value) == {"scalar", "dtype"}:
+        return np.dtype(value["dtype"]).type(value["scalar"])
+    return value
+
+
+def pack_logbook(logbook):
+    """
+    Returns the header, records and chapters of the logbook, nested chapters included
+    """
+    return {
+        "header": logbook.header,
+        "records": list(logbook),
+        "chapters": {name: pack_logbook(chapter) for name, chapter in logbook.chapters.items()},
+    }
+
+
+def unpack_logbook(packed):
+    logbook = tools.Logbook()
+    logbook.header = packed["header"]
+    # Appended, record would move the chapter fields of a record to its chapters again
+    logbook.extend(packed["records"])
+    for name, chapter in packed.get("chapters", {}).items():
+        logbook.chapters[name] = unpack_logbook(chapter)
+    return logbook
+
+
+def get_random_states():
+    version, state, gauss_next = random.getstate()
+    legacy = np.random.get_state()
+    return {
+        "random": [version, list(state), gauss_next],
+        "numpy": [legacy[0], legacy[1].tolist(), int(legacy[2]), int(legacy[3]), float(legacy[4])],
+        "bitmatrix": bitmatrix.rng.bit_generator.state,
+    }
+
+
+def set_random_states(states):
+    version, state, gauss_next = states["random"]
+    random.setstate((version, tuple(state), gauss_next))
+    name, keys, pos, has_gauss, cached_gaussian = states["numpy"]
+    np.random.set_state((name, np.array(keys, dtype=np.uint32), pos, has_gauss, cached_gaussian))
+    bitmatrix.rng.bit_generator.state = states["bitmatrix"]
+
+
+class Checkpoint:
+    """
+    Saves the state of :func:`custom_deap.eaSimple` every *generations* generations
+    or *minutes* minutes, and restores it to resume a run. Restoring the random
+    states of random, numpy and bitmatrix makes the resumed run continue like
+    the uninterrupted one.
+
+    The file is an .npz holding the population and hall of fame genes packed 8
+    per byte, their fitness values, which of them a surrogate predicted, and a
+    JSON entry with the generation, the logbook with its chapters, the state of
+    the stopping criteria and the random states. It is written to a temporary
+    file and renamed, so a killed run leaves the previous checkpoint intact.
+
+    :param str path: Checkpoint file
+    :param int generations: Generations between checkpoints, optional
+    :param float minutes: Minutes between checkpoints, optional
+    :param individual_class: Class of the individuals of list populations, e.g. creator.Individual
+    """
+
+    def __init__(self, path, generations=None, minutes=None, individual_class=list):
+        self.path = path
+        self.generations = generations
+        self.minutes = minutes
+        self.individual_class = individual_class
+        self.saved_time = time.time()
+        self.state = None
+
+    def load(self):
+        """
+        Reads the checkpoint file, to be restored by eaSimple. Returns the generation it was taken at.
+        """
+        with np.load(self.path) as saved:
+            self.state = {name: saved[name] for name in saved.files}
+        self.state["meta"] = json.loads(self.state["meta"].tobytes().decode(), object_hook=from_json)
+        return self.state["meta"]["gen"]
+
+    def update(self, gen, population, halloffame, logbook, stop=None):
+        """
+        Saves the state if a checkpoint is due after generation gen
+        """
+        due = self.generations is not None and gen % self.generations == 0
+        due = due or (
+            self.minutes is not None and time.time() - self.saved_time >= self.minutes * 60
+        )
+        if due:
+            self.save(gen, population, halloffame, logbook, stop)
+
+    def save(self, gen, population, halloffame, logbook, stop=None):
+        genes, fitness = pack_population(population)
+        hof_genes, hof_fitness = (
+            pack_population(list(halloffame.items))
+            if halloffame is not None and len(halloffame) > 0
+            else (np.empty((0, genes.shape[1]), dtype=np.uint8), np.empty((0, fitness.shape[1])))
+        )
+        meta = {
+            "gen": gen,
+            "size": len(population[0]),
+            "weights": list(population[0].fitness.weights),
+            "logbook": pack_logbook(logbook),
+            "stop": [
+                [type(criterion).__name__, criterion.state() if hasattr(criterion, "state") else None]
+                for criterion in stop or []
+            ],
+            "random_states": get_random_states(),
+        }
+        meta = np.frombuffer(json.dumps(meta, default=to_json).encode(), dtype=np.uint8)
+
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez_compressed(
+                f,
+                genes=genes,
+                fitness=fitness,
+                hof_genes=hof_genes,
+                hof_fitness=hof_fitness,
+                approximate=approximate_flags(population),
+                meta=meta,
+            )
+        os.replace(tmp_path, self.path)
+        self.saved_time = time.time()
+
+    def restore(self, population, halloffame, stop=None):
+        """
+        Replaces population in place and fills halloffame with the loaded state and
+        restores the random states and the state of the stopping criteria, matched
+        by position and class. Returns the generation and the logbook.
+        """
+        meta = self.state["meta"]
+        size = meta["size"]
+        if isinstance(population, BitPopulation):
+            population[:] = BitPopulation(
+                self.state["genes"], size, tuple(meta["weights"]), self.state["fitness"][:, 0].copy()
+            )
+        else:
+            population[:] = unpack_individuals(
+                self.state["genes"],
+                self.state["fitness"],
+                size,
+                self.individual_class,
+                self.state.get("approximate"),
+            )
+
+        if halloffame is not None:
+            items = unpack_individuals(
+                self.state["hof_genes"],
+                self.state["hof_fitness"],
+                size,
+                halloffame.individual_class if isinstance(halloffame, BitHallOfFame) else self.individual_class,
+            )
+            # Empty when the checkpoint was taken before any valid fitness
+            if items and isinstance(halloffame, BitHallOfFame):
+                halloffame.update(BitPopulation.from_individuals(items, tuple(meta["weights"])))
+            elif items:
+                halloffame.update(items)
+
+        logbook = unpack_logbook(meta["logbook"])
+
+        for criterion, (name, state) in zip(stop or [], meta.get("stop", [])):
+            if type(criterion).__name__ == name and state is not None:
+                criterion.set_state(state)
+
+        set_random_states(meta["random_states"])
+        return meta["gen"], logbook
@@ -0,0 +1,19 @@
+import os
+import time
+import data
+
+# Writes the binary bundle of the input data, loaded by data.py instead of the input files
+start_time = time.perf_counter()
+data.compile_bundle()
+print(f"Bundle written to {data.bundle_dir} in {time.perf_counter() - start_time:.3f} s")
+
+if os.path.exists(data.raster_file):
+    start_time = time.perf_counter()
+    data.compile_cropped_raster()
+    print(f"Cropped raster written to {data.cropped_raster_file} in {time.perf_counter() - start_time:.3f} s")
+else:
+    print(f"{data.raster_file} missing, the cropped raster was not written")
+
+start_time = time.perf_counter()
+data.load_bundle()
+print(f"Bundle load time: {time.perf_counter() - start_time:.3f} s")
@@ -1,6 +1,7 @@
 import random
 import time
 from deap import tools
+import profiling
 
 def varAnd(population, toolbox, cxpb, mutpb):
     r"""Part of an evolutionary algorithm applying only the variation part
@@ -27,7 +28,8 @@ def varAnd(population, toolbox, cxpb, mutpb):
     parents in :math:`P_\mathrm{o}`. A second loop over the resulting
     :math:`P_\mathrm{o}` is executed to mutate every individual with a
     probability *mutpb*. When an individual is mutated it replaces its not
-    mutated version in :math:`P_\mathrm{o}`. The resulting :math:`P_\mathrm{o}`
+    mutated version in :math:`P_\mathrm{o}`. Offspring that end up identical
+    to their parent keep its fitness. The resulting :math:`P_\mathrm{o}`
     is returned.
 
     This variation is named *And* because of its propensity to apply both
@@ -37,20 +39,27 @@ def varAnd(population, toolbox, cxpb, mutpb):
     according to the given probabilities. Both probabilities should be in
     :math:`[0, 1]`.
     """
-    offspring = [toolbox.clone(ind) for ind in population]
+    with profiling.phase("clone"):
+        offspring = [toolbox.clone(ind) for ind in population]
 
-    # Apply crossover and mutation on the offspring
-    for i in range(1, len(offspring), 2):
-        if random.random() < cxpb:
-            offspring[i - 1], offspring[i] = toolbox.mate(
-                offspring[i - 1], offspring[i]
-            )
-            del offspring[i - 1].fitness.values, offspring[i].fitness.values
+    with profiling.phase("variation"):
+        # Apply crossover and mutation on the offspring
+        for i in range(1, len(offspring), 2):
+            if random.random() < cxpb:
+                offspring[i - 1], offspring[i] = toolbox.mate(
+                    offspring[i - 1], offspring[i]
+                )
+                del offspring[i - 1].fitness.values, offspring[i].fitness.values
 
-    for i in range(len(offspring)):
-        if random.random() < mutpb:
-            (offspring[i],) = toolbox.mutate(offspring[i])
-            del offspring[i].fitness.values
+        for i in range(len(offspring)):
+            if random.random() < mutpb:
+                (offspring[i],) = toolbox.mutate(offspring[i])
+                del offspring[i].fitness.values
+
+        # Keep the fitness of offspring whose genes did not actually change
+        for child, parent in zip(offspring, population):
+            if not child.fitness.valid and parent.fitness.valid and child == parent:
+                child.fitness.values = parent.fitness.values
 
     return offspring
 
@@ -65,6 +74,11 @@ def eaSimple(
     verbose=__debug__,
     trial=None,
     optuna=None,
+    monitors=None,
+    migrate=None,
+    checkpoint=None,
+    stop=None,
+    surrogate=None,
 ):
     """This algorithm reproduce the simplest evolutionary algorithm as
     presented in chapter 7 of [Back2000]_.
@@ -80,6 +94,26 @@ def eaSimple(
     :param halloffame: A :class:`~deap.tools.HallOfFame` object that will
                        contain the best individuals, optional.
     :param verbose: Whether or not to log the statistics.
+    :param monitors: Objects logging extra fields each generation, optional.
+                     Each one has a ``fields`` list and a ``record`` method
+                     taking the individuals evaluated in the generation and
+                     returning a dict with those fields.
+    :param migrate: Function called with the population and the generation
+                    number at the end of each generation, e.g. an
+                    :class:`islands.Migration`, optional.
+    :param checkpoint: A :class:`checkpoint.Checkpoint` saving the state
+                       during the run, optional. When its file was loaded
+                       the run resumes after the saved generation, unless
+                       the saved run had stopped.
+    :param stop: Stopping criteria, see :mod:`stopping`, optional. Each one
+                 is called with the generation, population, hall of fame and
+                 logbook and returns the reason to stop or None. The reason
+                 is added to the record of that generation as *stop*.
+    :param surrogate: A :class:`surrogate.CoarseRasterSurrogate` screening the
+                      offspring, optional. Only the offspring it returns are
+                      evaluated and counted in nevals, the others keep their
+                      predicted fitness until selected again and stay out of
+                      the hall of fame and the statistics.
     :returns: The final population
     :returns: A class:`~deap.tools.Logbook` with the statistics of the
               evolution
@@ -119,61 +153,123 @@ def eaSimple(
 
     This function expects the :meth:`toolbox.mate`, :meth:`toolbox.mutate`,
     :meth:`toolbox.select` and :meth:`toolbox.evaluate` aliases to be
-    registered in the toolbox.
+    registered in the toolbox. When a :meth:`toolbox.vary` alias taking
+    ``(offspring, cxpb, mutpb)`` is registered it replaces :func:`varAnd`, as
+    done by the vectorized operators of a :class:`bitmatrix.BitPopulation`.
 
     .. [Back2000] Back, Fogel and Michalewicz, "Evolutionary Computation 1 :
        Basic Algorithms and Operators", 2000.
     """
-    logbook = tools.Logbook()
-    logbook.header = ["gen", "nevals", "time"] + (stats.fields if stats else [])
+    monitors = monitors or []
+
+    if checkpoint is not None and checkpoint.state is not None:
+        start_gen, logbook = checkpoint.restore(population, halloffame, stop)
+        start_gen += 1
+        # The saved run had already met a stopping criterion
+        if "stop" in logbook[-1]:
+            if verbose:
+                print(f"Resumed a run stopped at generation {logbook[-1]['gen']}")
+            return population, logbook
+    else:
+        start_gen = 1
+        logbook = tools.Logbook()
+        logbook.header = (
+            ["gen", "nevals", "time"]
+            + [field for monitor in monitors for field in monitor.fields]
+            + (stats.fields if stats else [])
+        )
 
-    # Evaluate the individuals with an invalid fitness
-    invalid_ind = [ind for ind in population if not ind.fitness.valid]
-    fitnesses = toolbox.map(toolbox.evaluate, invalid_ind)
-    for ind, fit in zip(invalid_ind, fitnesses):
-        ind.fitness.values = fit
+        # Evaluate the individuals with an invalid fitness
+        invalid_ind = [ind for ind in population if not ind.fitness.valid]
+        fitnesses = toolbox.map(toolbox.evaluate, invalid_ind)
+        for ind, fit in zip(invalid_ind, fitnesses):
+            ind.fitness.values = fit
+        if surrogate is not None:
+            surrogate.update(invalid_ind)
 
-    if halloffame is not None:
-        halloffame.update(population)
+        if halloffame is not None:
+            halloffame.update(population)
 
-    record = stats.compile(population) if stats else {}
-    logbook.record(gen=0, nevals=len(invalid_ind), time=0, **record)
-    if verbose:
-        print(logbook.stream)
+        record = stats.compile(population) if stats else {}
+        for monitor in monitors:
+            record.update(monitor.record(invalid_ind))
+        logbook.record(gen=0, nevals=len(invalid_ind), time=0, **record)
+        if verbose:
+            print(logbook.stream)
 
     # Begin the generational process
-    for gen in range(1, ngen + 1):
+    for gen in range(start_gen, ngen + 1):
         start_time = time.time()  # Start time of the generation
         
         # Select the next generation individuals
-        offspring = toolbox.select(population, len(population))
+        with profiling.phase("select"):
+            offspring = toolbox.select(population, len(population))
 
         # Vary the pool of individuals
-        offspring = varAnd(offspring, toolbox, cxpb, mutpb)
+        with profiling.phase("vary"):
+            if hasattr(toolbox, "vary"):
+                offspring = toolbox.vary(offspring, cxpb, mutpb)
+            else:
+                offspring = varAnd(offspring, toolbox, cxpb, mutpb)
 
         # Evaluate the individuals with an invalid fitness
-        invalid_ind = [ind for ind in offspring if not ind.fitness.valid]
-        fitnesses = toolbox.map(toolbox.evaluate, invalid_ind)
-        for ind, fit in zip(invalid_ind, fitnesses):
-            ind.fitness.values = fit
+        with profiling.phase("evaluate"):
+            if surrogate is None:
+                invalid_ind = [ind for ind in offspring if not ind.fitness.valid]
+            else:
+                with profiling.phase("surrogate"):
+                    invalid_ind = surrogate.screen(offspring)
+            fitnesses = toolbox.map(toolbox.evaluate, invalid_ind)
+            for ind, fit in zip(invalid_ind, fitnesses):
+                ind.fitness.values = fit
+        if surrogate is not None:
+            with profiling.phase("surrogate"):
+                surrogate.update(invalid_ind)
 
         # Update the hall of fame with the generated individuals
-        if halloffame is not None:
-            halloffame.update(offspring)
+        with profiling.phase("halloffame"):
+            if halloffame is not None:
+                halloffame.update(offspring if surrogate is None else surrogate.exact(offspring))
 
         # Replace the current population by the offspring
         population[:] = offspring
 
+        # Exchange individuals with other populations
+        if migrate is not None:
+            with profiling.phase("migrate"):
+                migrate(population, gen)
+
         # Calculate the time taken for this generation
         end_time = time.time()
         generation_time = (end_time - start_time)
 
         # Append the current generation statistics to the logbook
-        record = stats.compile(population) if stats else {}
+        with profiling.phase("stats"):
+            if stats and surrogate is not None:
+                record = stats.compile(surrogate.exact(population))
+            else:
+                record = stats.compile(population) if stats else {}
+        for monitor in monitors:
+            record.update(monitor.record(invalid_ind))
         logbook.record(gen=gen, nevals=len(invalid_ind), time=generation_time, **record)
         if verbose:
             print(logbook.stream)
 
+        reason = None
+        for criterion in stop or []:
+            reason = criterion(gen, population, halloffame, logbook)
+            if reason is not None:
+                logbook[-1]["stop"] = reason
+                if verbose:
+                    print(f"Stopped at generation {gen}: {reason}")
+                break
+
+        if checkpoint is not None and reason is not None:
+            # Saved even when not due, so resuming sees the run stopped
+            checkpoint.save(gen, population, halloffame, logbook, stop)
+        elif checkpoint is not None:
+            checkpoint.update(gen, population, halloffame, logbook, stop)
+
         if trial and optuna:
             # Report intermediate objective value.
             trial.report(halloffame[0].fitness.values[0], gen)
@@ -182,4 +278,7 @@ def eaSimple(
             if trial.should_prune():
                 raise optuna.TrialPruned()
 
+        if reason is not None:
+            break
+
     return population, logbook
@@ -1,23 +1,55 @@
 import json
-import geopandas as gpd
-
-# Valencia region
-valencia_region_polygon = gpd.read_file("./data/valencia_region.geojson").dissolve()[
-    "geometry"
-][0]
+import os
 
 # Raster file for pop calculations
 raster_file = "./data/spain_pop.tif"
 
+# Input files
+region_file = "./data/valencia_region.geojson"
+possible_locations_file = "./data/possible_locations.json"
+current_locations_file = "./data/current_locations.json"
+heuristic_file = "./results/max_population_min_overlap_heuristic.json"
+source_files = [
+    region_file,
+    possible_locations_file,
+    current_locations_file,
+    heuristic_file,
+]
+
+# Binary bundle of the input files, written by compile_input_data.py
+bundle_dir = "./data/compiled"
+
+# Population raster cropped to the region, written by compile_input_data.py: the raw
+# pixels and the JSON sidecar describing them, see compile_cropped_raster
+cropped_raster_file = f"{bundle_dir}/population.json"
+cropped_raster_data = "population.int32"
+
+# Module attributes loaded on first access, see __getattr__
+input_data_names = [
+    "valencia_region_polygon",
+    "possible_locations",
+    "individual_size",
+    "current_locations",
+    "heuristic_individual",
+]
+
+
+def load_region_polygon(path=region_file):
+    import geopandas as gpd
+
+    # Valencia region
+    return gpd.read_file(path).dissolve()["geometry"][0]
+
+
 def load_input_data():
     try:
-        with open("./data/possible_locations.json") as f:
+        with open(possible_locations_file) as f:
             possible_locations = json.load(f)
 
-        with open("./data/current_locations.json") as f:
+        with open(current_locations_file) as f:
             current_locations = json.load(f)
 
-        with open("./results/max_population_min_overlap_heuristic.json") as f:
+        with open(heuristic_file) as f:
             heuristic_individual = json.load(f)["solution"]
             return (
                 possible_locations,
@@ -30,7 +62,169 @@ def load_input_data():
         print({"error": error})
 
 
-# Load input data
-possible_locations, individual_size, current_locations, heuristic_individual = (
-    load_input_data()
-)
+def source_stamps(paths=source_files):
+    """
+    Returns the modification time and size of each input file
+    """
+    stamps = {}
+    for path in paths:
+        stat = os.stat(path)
+        stamps[path] = [stat.st_mtime_ns, stat.st_size]
+    return stamps
+
+
+def compile_bundle():
+    """
+    Writes the input files to bundle_dir: the region polygon as WKB, the
+    locations as float64 .npy arrays, the heuristic individual as packed bits
+    and a manifest with the stamps of the input files.
+    """
+    import numpy as np
+
+    stamps = source_stamps()
+    region = load_region_polygon()
+    possible_locations, individual_size, current_locations, heuristic_individual = (
+        load_input_data()
+    )
+
+    os.makedirs(bundle_dir, exist_ok=True)
+    with open(f"{bundle_dir}/region.wkb", "wb") as f:
+        f.write(region.wkb)
+    np.save(f"{bundle_dir}/possible_locations.npy", np.asarray(possible_locations, dtype=np.float64))
+    np.save(f"{bundle_dir}/current_locations.npy", np.asarray(current_locations, dtype=np.float64))
+    np.save(f"{bundle_dir}/heuristic_individual.npy", np.packbits(np.asarray(heuristic_individual, dtype=np.uint8)))
+
+    # Written last, so an interrupted compilation leaves an invalid bundle
+    manifest = {"sources": stamps, "individual_size": individual_size}
+    with open(f"{bundle_dir}/manifest.json.tmp", "w") as f:
+        json.dump(manifest, f)
+    os.replace(f"{bundle_dir}/manifest.json.tmp", f"{bundle_dir}/manifest.json")
+
+
+def load_bundle():
+    """
+    Returns the input data of the bundle, or None if it is missing or older
+    than the input files
+    """
+    try:
+        with open(f"{bundle_dir}/manifest.json") as f:
+            manifest = json.load(f)
+        if manifest["sources"] != source_stamps():
+            return None
+    except FileNotFoundError:
+        return None
+
+    import numpy as np
+    from shapely import from_wkb
+
+    with open(f"{bundle_dir}/region.wkb", "rb") as f:
+        region = from_wkb(f.read())
+    individual_size = manifest["individual_size"]
+    return {
+        "valencia_region_polygon": region,
+        "possible_locations": np.load(f"{bundle_dir}/possible_locations.npy").tolist(),
+        "individual_size": individual_size,
+        "current_locations": np.load(f"{bundle_dir}/current_locations.npy").tolist(),
+        "heuristic_individual": np.unpackbits(
+            np.load(f"{bundle_dir}/heuristic_individual.npy"), count=individual_size
+        ).tolist(),
+    }
+
+
+def compile_cropped_raster():
+    """
+    Writes the pixels of raster_file inside the bounding box of the region as raw
+    little-endian int32, with NoData set to 0, and a JSON sidecar written last with
+    the geotransform and size of raster_file and the offsets of the crop. Pixels are
+    read by their indices in raster_file, so populations match it exactly.
+    """
+    import rasterio
+    from rasterio.windows import Window
+    from utils import pixel_window
+
+    stamps = source_stamps([raster_file, region_file])
+    region = load_region_polygon()
+    with rasterio.open(raster_file) as raster:
+        gt = raster.transform.to_gdal()
+        x_start, y_start, x_end, y_end = pixel_window(gt, raster.width, raster.height, region.bounds)
+        values = raster.read(
+            1,
+            window=Window(x_start, y_start, x_end - x_start + 1, y_end - y_start + 1),
+            out_dtype="int32",
+        )
+        sidecar = {
+            "data": cropped_raster_data,
+            "width": values.shape[1],
+            "height": values.shape[0],
+            "x_offset": x_start,
+            "y_offset": y_start,
+            "raster_width": raster.width,
+            "raster_height": raster.height,
+            "geotransform": list(gt),
+            "nodata": raster.nodata,
+            "sources": stamps,
+        }
+    if sidecar["nodata"] is not None:
+        values[values == int(sidecar["nodata"])] = 0
+
+    os.makedirs(bundle_dir, exist_ok=True)
+    data_path = f"{bundle_dir}/{cropped_raster_data}"
+    values.astype("<i4").tofile(f"{data_path}.tmp")
+    os.replace(f"{data_path}.tmp", data_path)
+    with open(f"{cropped_raster_file}.tmp", "w") as f:
+        json.dump(sidecar, f)
+    os.replace(f"{cropped_raster_file}.tmp", cropped_raster_file)
+
+
+def population_raster():
+    """
+    Returns the sidecar of the cropped raster if it is up to date with raster_file and
+    the region, raster_file otherwise. Both are read by RasterContext and load_region_pixels.
+    """
+    try:
+        with open(cropped_raster_file) as f:
+            sidecar = json.load(f)
+        if sidecar["sources"] != source_stamps([raster_file, region_file]):
+            return raster_file
+    except OSError:
+        return raster_file
+    return cropped_raster_file
+
+
+def load_data():
+    """
+    Loads the input data from the bundle when it is up to date, from the input files otherwise
+    """
+    data = load_bundle()
+    if data is not None:
+        return data
+
+    possible_locations, individual_size, current_locations, heuristic_individual = (
+        load_input_data()
+    )
+    return {
+        "valencia_region_polygon": load_region_polygon(),
+        "possible_locations": possible_locations,
+        "individual_size": individual_size,
+        "current_locations": current_locations,
+        "heuristic_individual": heuristic_individual,
+    }
+
+
+def set_input_data(**values):
+    """
+    Replaces the input data and the raster file, e.g. with the synthetic data of benchmark.py.
+    Modules reading them at import, like ga_functions, must be imported afterwards.
+    """
+    unknown = set(values) - set(input_data_names) - {"raster_file"}
+    if unknown:
+        raise ValueError(f"Unknown input data: {sorted(unknown)}")
+    globals().update(values)
+
+
+def __getattr__(name):
+    # Load input data on first access
+    if name not in input_data_names:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    globals().update(load_data())
+    return globals()[name]
@@ -0,0 +1,171 @@
+import fcntl
+import functools
+import hashlib
+import os
+import pickle
+from collections import OrderedDict
+import numpy as np
+
+
+def individual_key(individual):
+    """
+    Returns a hash of the indices of the genes set to 1
+
+    :param list individual: Solution / individual list
+    """
+    indices = np.flatnonzero(np.asarray(individual)).astype(np.int32)
+    return hashlib.blake2b(indices.tobytes(), digest_size=16).digest()
+
+
+class FitnessCache:
+    """
+    Bounded LRU cache of fitness values keyed by :func:`individual_key`.
+
+    Register it as a decorator of the raw fitness, before the penalty, so the
+    cached values do not depend on the penalty settings and can be shared
+    between runs ::
+
+        toolbox.register("evaluate", eval_fitness)
+        toolbox.decorate("evaluate", cache)
+        toolbox.decorate("evaluate", tools.DeltaPenality(feasible, penalty))
+
+    When individuals are evaluated by a pool, wrap its map instead with
+    :meth:`wrap_map`. Passed to :func:`custom_deap.eaSimple` as a monitor,
+    it logs the hits, misses and evictions of each generation.
+
+    :param int maxsize: Maximum number of cached individuals
+    :param str path: File the cache is loaded from and saved to, optional
+    :param str namespace: Identifies what the values were computed with (evaluator,
+                          input data...). A file saved with another namespace is ignored
+                          when loading and never overwritten by :meth:`sync`.
+    """
+
+    fields = ["cache_hits", "cache_misses", "cache_evictions"]
+
+    def __init__(self, maxsize=100000, path=None, namespace=""):
+        self.maxsize = maxsize
+        self.path = path
+        self.namespace = namespace
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if path is not None and os.path.exists(path):
+            self.load(path)
+
+    def get(self, key):
+        fitness = self.entries.get(key)
+        if fitness is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.entries.move_to_end(key)
+        return fitness
+
+    def put(self, key, fitness):
+        self.entries[key] = tuple(fitness)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def __call__(self, func):
+        @functools.wraps(func)
+        def wrapper(individual, *args, **kwargs):
+            key = individual_key(individual)
+            fitness = self.get(key)
+            if fitness is None:
+                fitness = func(individual, *args, **kwargs)
+                self.put(key, fitness)
+            return fitness
+
+        return wrapper
+
+    def wrap_map(self, map_func, feasible=None):
+        """
+        Returns a ``toolbox.map`` replacement that only sends cache misses to map_func.
+
+        :param map_func: Map evaluating the individuals, e.g. EvaluationPool.map
+        :param feasible: When map_func returns penalized fitnesses, only individuals
+                         passing this check are cached, optional
+        """
+
+        def cached_map(func, individuals):
+            individuals = list(individuals)
+            fitnesses = [None] * len(individuals)
+            keys = {}
+            pending = []
+            for i, ind in enumerate(individuals):
+                if feasible is not None and not feasible(ind):
+                    pending.append(i)
+                    continue
+                keys[i] = individual_key(ind)
+                fitnesses[i] = self.get(keys[i])
+                if fitnesses[i] is None:
+                    pending.append(i)
+
+            results = map_func(func, [individuals[i] for i in pending])
+            for i, fitness in zip(pending, results):
+                fitnesses[i] = fitness
+                if i in keys:
+                    self.put(keys[i], fitness)
+            return fitnesses
+
+        return cached_map
+
+    def record(self, individuals):
+        record = {
+            "cache_hits": self.hits,
+            "cache_misses": self.misses,
+            "cache_evictions": self.evictions,
+        }
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        return record
+
+    def load(self, path):
+        with open(path, "rb") as f:
+            saved = pickle.load(f)
+        if saved["namespace"] != self.namespace:
+            print(f"Ignoring fitness cache {path}: computed for {saved['namespace']}")
+            return
+        self.merge(saved["entries"])
+        self.evictions = 0
+
+    def merge(self, entries):
+        for key, fitness in entries.items():
+            self.put(key, fitness)
+
+    def save(self, path=None):
+        """
+        Writes the cache atomically, so a killed run never leaves a truncated file
+        """
+        path = path or self.path
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump({"namespace": self.namespace, "entries": dict(self.entries)}, f)
+        os.replace(tmp_path, path)
+
+    def sync(self, path=None):
+        """
+        Adds the entries of the file to the cache and saves the union, holding a
+        lock on path.lock, so processes sharing the file keep each other's values.
+        Raises ValueError if the file was saved with another namespace.
+        """
+        path = path or self.path
+        with open(f"{path}.lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            if os.path.exists(path):
+                with open(path, "rb") as f:
+                    saved = pickle.load(f)
+                if saved["namespace"] != self.namespace:
+                    raise ValueError(
+                        f"Fitness cache {path} was computed for {saved['namespace']}, "
+                        f"not {self.namespace}"
+                    )
+                evictions = self.evictions
+                self.merge(saved["entries"])
+                self.evictions = evictions
+            self.save(path)
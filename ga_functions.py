@@ -1,14 +1,27 @@
 from deap import creator
-from utils import get_solution_coords, voronoi_division
+from utils import (
+    get_solution_coords,
+    voronoi_cells,
+    cells_to_ragged_arrays,
+    load_region_pixels,
+    nearest_site_populations,
+)
 from data import (
     individual_size,
     possible_locations,
     valencia_region_polygon,
     heuristic_individual,
     raster_file,
+    population_raster,
 )
+import os
+import hashlib
 import random
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import numpy as np
 import population_calculator
+import profiling
 
 max_containers = 352
 service_level = 1 * 1000  # Service level, containers per inhabitants
@@ -39,31 +52,162 @@ def create_heuristic_individual(probability=0.01):
     return creator.Individual(swapped_list)
 
 
-def eval_fitness(solution, possible_locations=possible_locations):
-    # Get solution coords
-    solution_coords = get_solution_coords(solution, possible_locations)
+# Raster datasets opened once per process by path, see get_raster_context
+raster_contexts = {}
+raster_context_pid = None
+default_raster = None
+
+
+def get_raster_context(path=None):
+    """
+    Returns the population raster context of the current process, opening it on first use.
+
+    GDAL handles cannot be shared with forked processes, so a child reopens the raster.
+
+    :param str path: Raster file or cropped raster sidecar, by default data.population_raster().
+                     The cropped raster only covers the region, geometries reaching outside
+                     of it, like isochrones, need data.raster_file.
+    """
+    global raster_contexts, raster_context_pid, default_raster
+    if raster_context_pid != os.getpid():
+        raster_contexts = {}
+        raster_context_pid = os.getpid()
+        # Resolved once, it reads the sidecar and the source files
+        default_raster = population_raster()
+    if path is None:
+        path = default_raster
+    if path not in raster_contexts:
+        raster_contexts[path] = population_calculator.RasterContext(path)
+        if path == default_raster:
+            profiling.watch_counters("raster", raster_contexts[path].counters)
+    return raster_contexts[path]
+
 
-    division = voronoi_division(solution_coords, valencia_region_polygon)
+# Thread pools computing the cells of one individual concurrently, by process and size
+cell_executors = {}
 
-    # Append population to each voronoi polygon
-    scores = []
-    for polygon in division:
-        try:
-            population = population_calculator.calculate_population(
-                polygon, raster_file
+
+def get_cell_executor(threads):
+    key = (os.getpid(), threads)
+    if key not in cell_executors:
+        cell_executors[key] = ThreadPoolExecutor(max_workers=threads)
+    return cell_executors[key]
+
+
+def eval_fitness(solution, possible_locations=possible_locations, threads=1, cells=None):
+    """
+    Fitness of a solution: population above the service level summed over its clipped Voronoi cells.
+
+    :param list solution: Solution / individual list
+    :param list possible_locations: Locations in [lon, lat] format
+    :param int threads: Threads computing the population of the cells concurrently.
+                        population_calculator releases the GIL, so they run in parallel.
+    :param ndarray cells: Voronoi cells of the solution from utils.voronoi_cells, computed
+                          if not given. Lets callers reuse them, e.g. for write_results.
+    """
+    if cells is None:
+        # Get solution coords
+        with profiling.phase("coords"):
+            solution_coords = get_solution_coords(solution, possible_locations)
+        cells = voronoi_cells(solution_coords, valencia_region_polygon)
+    profiling.count("cells", len(cells))
+
+    # Get population of each voronoi polygon
+    context = get_raster_context()
+    if threads > 1:
+        # Interleave the cells so every thread gets a similar area
+        chunks = [cells[k::threads] for k in range(threads)]
+        with profiling.phase("raster"):
+            populations = np.concatenate(
+                list(
+                    get_cell_executor(threads).map(
+                        lambda chunk: context.calculate_populations(
+                            *cells_to_ragged_arrays(chunk)
+                        ),
+                        chunks,
+                    )
+                )
             )
-        except RuntimeError as e:
-            population = 0.0
+    else:
+        with profiling.phase("ragged"):
+            arrays = cells_to_ragged_arrays(cells)
+        with profiling.phase("raster"):
+            populations = context.calculate_populations(*arrays)
 
-        # Get score
-        if population >= service_level:
-            score = population - service_level
-        else:
-            score = 0
+    # Get score
+    scores = np.maximum(populations - service_level, 0)
+
+    return (float(scores.sum()),)
+
+
+# Populated raster pixels inside the region, loaded on first use
+region_pixels = None
+
+
+def get_region_pixels():
+    global region_pixels
+    if region_pixels is None:
+        region_pixels = load_region_pixels(population_raster(), valencia_region_polygon)
+    return region_pixels
+
+
+def eval_fitness_raster(solution, possible_locations=possible_locations, cells=None):
+    """
+    Same score as eval_fitness, labelling each raster pixel with its nearest
+    active location instead of building and clipping the Voronoi cells.
+
+    :param ndarray cells: Unused, taken so both evaluators are called alike
+    """
+    # Get solution coords
+    with profiling.phase("coords"):
+        solution_coords = get_solution_coords(solution, possible_locations)
+    # No sites to label the pixels with, scored 0 like eval_fitness
+    if len(solution_coords) == 0:
+        return (0.0,)
+
+    pixel_coords, pixel_population = get_region_pixels()
+    with profiling.phase("nearest"):
+        populations = nearest_site_populations(
+            pixel_coords, pixel_population, solution_coords
+        )
+
+    # Get score
+    scores = np.maximum(populations - service_level, 0)
+
+    return (float(scores.sum()),)
 
-        scores.append(score)
 
-    return (sum(scores[i] for i in range(len(scores))),)
+# Available fitness evaluators
+evaluators = {"voronoi": eval_fitness, "raster": eval_fitness_raster}
+
+
+def evaluation_namespace(name):
+    """
+    Identifies the fitness values of an evaluator with the current input data and service level
+
+    :param str name: Key of evaluators
+    """
+    locations_hash = hashlib.blake2b(
+        np.asarray(possible_locations).tobytes(), digest_size=8
+    ).hexdigest()
+    return f"{name}:{raster_file}:{service_level}:{locations_hash}"
+
+
+def load_evaluator(name, threads=1):
+    """
+    Returns the evaluator called name with its raster data already loaded in this process
+
+    :param str name: Key of evaluators
+    :param int threads: Threads per evaluation, only used by the voronoi evaluator
+    """
+    if name == "raster":
+        get_region_pixels()
+        return evaluators[name]
+
+    get_raster_context()
+    if threads > 1:
+        return partial(eval_fitness, threads=threads)
+    return evaluators[name]
 
 
 def feasible(individual):
@@ -75,3 +219,84 @@ def feasible(individual):
 
 def distance(individual):
     return individual.count(1) - max_containers
+
+
+def mut_swap(individual, indpb):
+    """
+    Swap mutation: each gene set to 1 is moved, with probability indpb, to a
+    random gene set to 0. Keeps the number of containers.
+
+    :param list individual: Solution / individual list
+    :param float indpb: Independent probability of moving each container
+    """
+    genes = np.asarray(individual)
+    moved = [i for i in np.flatnonzero(genes == 1) if random.random() < indpb]
+    empty = np.flatnonzero(genes == 0).tolist()
+    for i, j in zip(moved, random.sample(empty, min(len(moved), len(empty)))):
+        individual[i], individual[j] = 0, 1
+    return (individual,)
+
+
+def cx_cardinality(ind1, ind2):
+    """
+    Uniform crossover keeping the number of containers of each parent. Genes
+    where the parents agree are kept, and the containers of the genes where
+    they differ are split at random, each child taking as many as its parent.
+
+    :param list ind1: First parent
+    :param list ind2: Second parent
+    """
+    genes1, genes2 = np.asarray(ind1), np.asarray(ind2)
+    differ = np.flatnonzero(genes1 != genes2).tolist()
+    chosen = set(random.sample(differ, int(genes1[differ].sum())))
+    for i in differ:
+        ind1[i] = 1 if i in chosen else 0
+        ind2[i] = 1 - ind1[i]
+    return ind1, ind2
+
+
+def repair(individual, max_ones=max_containers):
+    """
+    Moves an individual with more than max_ones containers to the nearest
+    feasible set in Hamming distance, clearing the excess genes at random
+
+    :param list individual: Solution / individual list
+    :param int max_ones: Maximum number of genes set to 1
+    """
+    ones = np.flatnonzero(np.asarray(individual) == 1).tolist()
+    for i in random.sample(ones, max(len(ones) - max_ones, 0)):
+        individual[i] = 0
+    return individual
+
+
+def repair_offspring(max_ones=max_containers):
+    """
+    Decorator of ``toolbox.mate`` and ``toolbox.mutate`` repairing the
+    offspring they return ::
+
+        toolbox.decorate("mate", repair_offspring())
+    """
+
+    def decorator(func):
+        def wrapper(*args, **kwargs):
+            offspring = func(*args, **kwargs)
+            for child in offspring:
+                repair(child, max_ones)
+            return offspring
+
+        return wrapper
+
+    return decorator
+
+
+class InfeasibleMonitor:
+    """
+    Counts the evaluated offspring that are not feasible, i.e. the
+    evaluations spent on individuals that only get the penalty. Pass it to
+    :func:`custom_deap.eaSimple` as a monitor.
+    """
+
+    fields = ["infeasible"]
+
+    def record(self, individuals):
+        return {"infeasible": sum(not feasible(ind) for ind in individuals)}
@@ -1,51 +1,65 @@
+import argparse
 import json
-import geopandas as gpd
-from shapely import Point
-import math
-from utils import remove_similar_locations
-
-# Valencia region
-valencia_region_polygon = gpd.read_file("./data/valencia_region.geojson").dissolve()[
-    "geometry"
-][0]
-
-# Load solid containers data (to get a huge amount possible locations)
-solid_containers = []
-with open("./data/contenidors-residus-solids-contenidores-residuos-solidos.json") as f:
-    solid_containers = json.load(f)
-
-# Load oil containers data (to get current locations)
-oil_containers = []
-with open("./data/contenidors-oli-usat-contenedores-aceite-usado.json") as f:
-    oil_containers = json.load(f)
-
-
-# Fill possible locations
-possible_locations = []
-
-# For each container
-for container in solid_containers:
-    # Get location
-    location = [container["geo_point_2d"]["lon"], container["geo_point_2d"]["lat"]]
-
-    # Check if locations is in valencia region
-    if valencia_region_polygon.contains(Point(location)):
-        # Then, append
-        possible_locations.append(location)
+import time
+import numpy as np
+from data import region_file, possible_locations_file, load_region_polygon
+from utils import (
+    read_container_locations,
+    filter_locations_in_region,
+    remove_similar_locations,
+)
+
+parser = argparse.ArgumentParser()
+parser.add_argument(
+    "--containers",
+    default="./data/contenidors-residus-solids-contenidores-residuos-solidos.json",
+    help="JSON array of containers used as possible locations",
+)
+parser.add_argument(
+    "--region",
+    default=region_file,
+    help="GeoJSON file with the region, its features are dissolved",
+)
+parser.add_argument(
+    "--output",
+    default=possible_locations_file,
+    help="Possible locations JSON file",
+)
+parser.add_argument(
+    "--threshold",
+    type=float,
+    default=10,
+    help="Locations closer than this distance (m) to a kept one are removed",
+)
+args = parser.parse_args()
+
+start_time = time.perf_counter()
+
+# Region
+region_polygon = load_region_polygon(args.region)
+
+# Fill possible locations with the solid containers in the region (to get a huge amount possible locations)
+possible_locations = np.concatenate(
+    [np.empty((0, 2))]
+    + [
+        filter_locations_in_region(locations, region_polygon)
+        for locations in read_container_locations(args.containers)
+    ]
+)
 
 # Remove similar locations
-possible_locations = remove_similar_locations(possible_locations)
+possible_locations = remove_similar_locations(
+    possible_locations.tolist(), args.threshold
+)
 
-with open("./data/possible_locations.json", "w") as f:
-    # indent=2 is not needed but makes the file human-readable
-    # if the data is nested
+with open(args.output, "w") as f:
     json.dump(possible_locations, f)
 
 # Calc individual size
 individual_size = len(possible_locations)
 
 print("Possible locations: ", individual_size)
-print("Input data saved in ./data/possible_locations.json")
+print(f"Input data saved in {args.output} in {time.perf_counter() - start_time:.2f}s")
 
 # Current locations
 # valencia_region_polygon = gpd.read_file("./data/valencia_region.geojson").dissolve()[
@@ -3,16 +3,23 @@ from utils import (
     generate_isochrones,
     write_results,
     get_solution_coords,
-    voronoi_division,
+    voronoi_cells,
 )
 from ga_functions import eval_fitness, max_containers
+import numpy as np
+from scipy.sparse import csr_matrix
+from shapely import STRtree, area, intersection
 
 # Isochrone range
 isochrone_range = 5  # minutes
 
 
 def max_population_heuristic(
-    possible_locations, individual_size, max_containers, isochrone_range
+    possible_locations,
+    individual_size,
+    max_containers,
+    isochrone_range,
+    evaluate=eval_fitness,
 ):
     """
     Selects a subset of locations that maximizes population ensuring the number of containers does not exceed max_containers.
@@ -35,9 +42,9 @@ def max_population_heuristic(
     num_containers = solution.count(1)
 
     if num_containers == max_containers:
-        fitness = eval_fitness(solution)[0]
         solution_coords = get_solution_coords(solution, possible_locations)
-        voronoi_polygons = voronoi_division(solution_coords, valencia_region_polygon)
+        voronoi_polygons = voronoi_cells(solution_coords, valencia_region_polygon)
+        fitness = evaluate(solution, cells=voronoi_polygons)[0]
         write_results(
             "max_population_heuristic",
             fitness,
@@ -50,32 +57,92 @@ def max_population_heuristic(
         return None
 
 
+class IsochroneOverlaps:
+    """
+    Isochrones of the locations sorted by descending population, with the areas of their
+    pairwise intersections in a sparse matrix. Only the pairs found by an STRtree are
+    intersected. The overlap ratio of isochrone i with j is overlaps[i, j] / areas[i].
+
+    :param list possible_locations: Locations in [lon, lat] format
+    :param int isochrone_range: Isochrone range in minutes
+    """
+
+    def __init__(self, possible_locations, isochrone_range):
+        points_and_pop = generate_isochrones(possible_locations, isochrone_range)
+        self.indices = [location["index"] for location in points_and_pop]
+        isochrones = np.array(
+            [location["isochrone"] for location in points_and_pop], dtype=object
+        )
+        self.areas = area(isochrones)
+
+        first, second = STRtree(isochrones).query(isochrones, predicate="intersects")
+        pairs = first != second
+        first, second = first[pairs], second[pairs]
+        self.overlaps = csr_matrix(
+            (area(intersection(isochrones[first], isochrones[second])), (first, second)),
+            shape=(len(isochrones), len(isochrones)),
+        )
+        # Column access, the isochrones overlapping a selected one
+        self.overlapped = self.overlaps.T.tocsr()
+
+    def select(self, threshold, max_containers):
+        """
+        Returns the indices of the locations picked by the greedy selection: in order of
+        population, an isochrone is selected if its intersection with every selected one
+        is smaller than threshold times its area.
+
+        :param float threshold: Maximum overlap ratio
+        :param int max_containers: Maximum number of selected locations
+        """
+        # Largest intersection of each isochrone with the selected ones
+        max_overlap = np.zeros(len(self.indices))
+        limits = self.areas * threshold
+
+        selected = []
+        for i in range(len(self.indices)):
+            if len(selected) >= max_containers:
+                break
+            if selected and not max_overlap[i] < limits[i]:
+                continue
+
+            selected.append(i)
+            start, end = self.overlapped.indptr[i], self.overlapped.indptr[i + 1]
+            neighbours = self.overlapped.indices[start:end]
+            max_overlap[neighbours] = np.maximum(
+                max_overlap[neighbours], self.overlapped.data[start:end]
+            )
+
+        return [self.indices[i] for i in selected]
+
+
+# IsochroneOverlaps of each isochrone range and set of locations, computed on first use
+isochrone_overlaps = {}
+
+
+def get_isochrone_overlaps(possible_locations, isochrone_range):
+    key = (isochrone_range, np.asarray(possible_locations, dtype=np.float64).tobytes())
+    if key not in isochrone_overlaps:
+        isochrone_overlaps[key] = IsochroneOverlaps(possible_locations, isochrone_range)
+    return isochrone_overlaps[key]
+
+
 def max_population_min_overlap_heuristic(
-    possible_locations, individual_size, max_containers, isochrone_range, threshold=0.56
+    possible_locations,
+    individual_size,
+    max_containers,
+    isochrone_range,
+    threshold=0.56,
+    evaluate=eval_fitness,
 ):
     """
     Selects a subset of locations that maximizes population while minimizing overlap and
     ensuring the number of containers does not exceed max_containers.
     """
-    # Get population
-    points_and_pop = generate_isochrones(possible_locations, isochrone_range)
-
-    selected_indices = []
-    selected_polygons = []
+    # Isochrones by population and their overlaps, shared by calls with the same range
+    overlaps = get_isochrone_overlaps(possible_locations, isochrone_range)
 
-    for location in points_and_pop:
-        if len(selected_indices) >= max_containers:
-            break
-
-        new_polygon = location["isochrone"]
-        # Check if the new polygon overlaps significantly with any of the already selected polygons
-        if all(
-            new_polygon.intersection(selected_polygon).area
-            < new_polygon.area * threshold
-            for selected_polygon in selected_polygons
-        ):
-            selected_indices.append(location["index"])
-            selected_polygons.append(new_polygon)
+    # Skip locations that overlap significantly with any of the already selected ones
+    selected_indices = overlaps.select(threshold, max_containers)
 
     # Initialize solution to 0s
     solution = [0] * individual_size
@@ -88,10 +155,9 @@ def max_population_min_overlap_heuristic(
     num_containers = solution.count(1)
 
     if num_containers <= max_containers:
-        fitness = eval_fitness(solution)[0]
-
         solution_coords = get_solution_coords(solution, possible_locations)
-        voronoi_polygons = voronoi_division(solution_coords, valencia_region_polygon)
+        voronoi_polygons = voronoi_cells(solution_coords, valencia_region_polygon)
+        fitness = evaluate(solution, cells=voronoi_polygons)[0]
         write_results(
             "max_population_min_overlap_heuristic",
             fitness,
@@ -0,0 +1,242 @@
+import random
+import numpy as np
+from scipy.spatial import Delaunay, QhullError, cKDTree
+from data import possible_locations
+from ga_functions import get_region_pixels, service_level
+
+
+class IncrementalEvaluator:
+    """
+    Fitness of a solution that is updated when single locations are added or
+    removed, instead of being recomputed from scratch.
+
+    It keeps the nearest active location of every populated region pixel
+    (the raster evaluator's model of the Voronoi cells), the pixels of each
+    location and its population. The cell of an added location only takes
+    pixels from the cells of its Delaunay neighbours, so only their pixels are
+    compared, and a removed location's pixels only move to its neighbours.
+    The fitness equals :func:`ga_functions.eval_fitness_raster` of the current
+    solution.
+
+    A pixel exactly as far from an added location as from its current one
+    stays where it is, while the full evaluation takes whichever of them
+    cKDTree.query returns. Such exact ties of float64 squared distances
+    are not expected with real coordinates; check_evaluators.py checks the
+    parity.
+
+    :param list solution: Solution / individual list
+    :param list possible_locations: Locations in [lon, lat] format
+    """
+
+    def __init__(self, solution, possible_locations=possible_locations):
+        self.locations = np.asarray(possible_locations, dtype=np.float64)
+        self.pixel_coords, self.pixel_population = get_region_pixels()
+        self.reset(solution)
+
+    def reset(self, solution):
+        """
+        Fully evaluates solution, discarding the current state
+        """
+        self.active = np.asarray(solution, dtype=bool).copy()
+        self.site_population = np.zeros(len(self.locations))
+        sites = np.flatnonzero(self.active)
+        if len(sites) == 0:
+            # Pixels without a location, taken by the first one added
+            self.owner = np.full(len(self.pixel_coords), -1)
+            self.distance = np.full(len(self.pixel_coords), np.inf)
+            self.members = {}
+            return
+
+        _, nearest = cKDTree(self.locations[sites]).query(self.pixel_coords)
+        self.owner = sites[nearest]
+        self.distance = self.squared_distances(self.owner)
+        self.site_population += np.bincount(
+            self.owner, weights=self.pixel_population, minlength=len(self.locations)
+        )
+
+        # Pixel indices of each location
+        order = np.argsort(self.owner, kind="stable")
+        owners, starts = np.unique(self.owner[order], return_index=True)
+        self.members = dict(zip(owners.tolist(), np.split(order, starts[1:])))
+
+    def squared_distances(self, sites, pixels=slice(None)):
+        delta = self.pixel_coords[pixels] - self.locations[sites]
+        return np.einsum("ij,ij->i", delta, delta)
+
+    def neighbours(self, index):
+        """
+        Returns the active locations that are Delaunay neighbours of location index
+        once it is added. All of them when the triangulation is degenerate.
+
+        :param int index: Index of an inactive location
+        """
+        sites = np.flatnonzero(self.active)
+        if len(sites) < 3:
+            return sites
+        try:
+            triangulation = Delaunay(np.vstack((self.locations[sites], self.locations[index])))
+        except QhullError:
+            return sites
+        if len(sites) in triangulation.coplanar[:, 0]:
+            # Left out of the triangulation, e.g. a duplicated location
+            return sites
+        indptr, indices = triangulation.vertex_neighbor_vertices
+        return sites[indices[indptr[len(sites)] : indptr[len(sites) + 1]]]
+
+    def add(self, index):
+        """
+        Activates a location. Returns the locations whose population changed.
+
+        :param int index: Index of the location
+        """
+        if self.active[index]:
+            return np.empty(0, dtype=np.int64)
+        if not self.active.any():
+            self.active[index] = True
+            self.reset(self.active)
+            return np.empty(0, dtype=np.int64)
+
+        neighbours = self.neighbours(index)
+        candidates = np.concatenate(
+            [self.members.get(site, np.empty(0, dtype=np.int64)) for site in neighbours]
+        )
+        distance = self.squared_distances(index, candidates)
+        moving = distance < self.distance[candidates]
+        moved = candidates[moving]
+        changed = np.unique(self.owner[moved])
+
+        self.site_population -= np.bincount(
+            self.owner[moved],
+            weights=self.pixel_population[moved],
+            minlength=len(self.locations),
+        )
+        self.site_population[index] = self.pixel_population[moved].sum()
+        self.owner[moved] = index
+        self.distance[moved] = distance[moving]
+        for site in changed.tolist():
+            pixels = self.members[site]
+            self.members[site] = pixels[self.owner[pixels] == site]
+        self.members[index] = moved
+        self.active[index] = True
+        return changed
+
+    def remove(self, index):
+        """
+        Deactivates a location. Returns the locations whose population changed.
+
+        :param int index: Index of the location
+        """
+        if not self.active[index]:
+            return np.empty(0, dtype=np.int64)
+
+        self.active[index] = False
+        moved = self.members.pop(index, np.empty(0, dtype=np.int64))
+        self.site_population[index] = 0.0
+        if not self.active.any():
+            self.reset(self.active)
+            return np.empty(0, dtype=np.int64)
+        if len(moved) == 0:
+            return np.empty(0, dtype=np.int64)
+
+        sites = np.flatnonzero(self.active)
+        _, nearest = cKDTree(self.locations[sites]).query(self.pixel_coords[moved])
+        new_owner = sites[nearest]
+
+        self.owner[moved] = new_owner
+        self.distance[moved] = self.squared_distances(new_owner, moved)
+        self.site_population += np.bincount(
+            new_owner,
+            weights=self.pixel_population[moved],
+            minlength=len(self.locations),
+        )
+        changed = np.unique(new_owner)
+        for site in changed.tolist():
+            self.members[site] = np.concatenate(
+                (self.members.get(site, np.empty(0, dtype=np.int64)), moved[new_owner == site])
+            )
+        return changed
+
+    def flip(self, index):
+        """
+        Adds the location if it is inactive, removes it otherwise
+        """
+        if self.active[index]:
+            return self.remove(index)
+        return self.add(index)
+
+    def apply(self, solution, max_changes=50):
+        """
+        Moves the state to solution, flipping only the genes that differ.
+        A full evaluation is done when more than max_changes genes differ.
+
+        :param list solution: Solution / individual list
+        :param int max_changes: Maximum number of incremental updates
+        """
+        target = np.asarray(solution, dtype=bool)
+        differ = np.flatnonzero(target != self.active)
+        if len(differ) > max_changes:
+            self.reset(target)
+            return
+
+        # Add first, so removed pixels have more candidates nearby
+        for index in differ[target[differ]]:
+            self.add(index)
+        for index in differ[~target[differ]]:
+            self.remove(index)
+
+    def fitness(self):
+        scores = np.maximum(self.site_population[self.active] - service_level, 0)
+        return (float(scores.sum()),)
+
+    def solution(self):
+        return self.active.astype(int).tolist()
+
+    def copy(self):
+        clone = object.__new__(IncrementalEvaluator)
+        clone.locations = self.locations
+        clone.pixel_coords = self.pixel_coords
+        clone.pixel_population = self.pixel_population
+        clone.active = self.active.copy()
+        clone.owner = self.owner.copy()
+        clone.distance = self.distance.copy()
+        clone.site_population = self.site_population.copy()
+        # Pixel arrays are replaced, never modified in place
+        clone.members = dict(self.members)
+        return clone
+
+
+def local_search(solution, steps, neighbours=10, possible_locations=possible_locations):
+    """
+    First-improvement local search swapping an active location with one of
+    its inactive nearest candidates. Keeps the number of containers.
+    Returns the improved solution and its fitness.
+
+    :param list solution: Solution / individual list
+    :param int steps: Number of swaps tried
+    :param int neighbours: Nearest candidate locations considered for each swap
+    :param list possible_locations: Locations in [lon, lat] format
+    """
+    evaluator = IncrementalEvaluator(solution, possible_locations)
+    _, nearest = cKDTree(evaluator.locations).query(
+        evaluator.locations, k=neighbours + 1
+    )
+    best_fitness = evaluator.fitness()
+
+    for _ in range(steps):
+        removed = random.choice(np.flatnonzero(evaluator.active))
+        candidates = [i for i in nearest[removed][1:] if not evaluator.active[i]]
+        if not candidates:
+            continue
+        added = random.choice(candidates)
+
+        evaluator.add(added)
+        evaluator.remove(removed)
+        fitness = evaluator.fitness()
+        if fitness < best_fitness:
+            best_fitness = fitness
+        else:
+            # Undo the swap
+            evaluator.add(removed)
+            evaluator.remove(added)
+
+    return evaluator.solution(), best_fitness
@@ -0,0 +1,193 @@
+import math
+import multiprocessing
+import queue
+import random
+import numpy as np
+from deap import tools
+import bitmatrix
+from bitmatrix import BitPopulation
+from parallel import pack_individual, unpack_individual
+
+
+def ring(island, islands):
+    return [(island + 1) % islands]
+
+
+def all_to_all(island, islands):
+    return [other for other in range(islands) if other != island]
+
+
+# Islands each island sends its migrants to
+topologies = {"ring": ring, "all": all_to_all}
+
+
+class Migration:
+    """
+    Sends the best individuals of an island to its neighbours every interval
+    generations, packed 8 genes per byte with their fitness, and replaces its
+    worst individuals with the ones received. Pass it to
+    :func:`custom_deap.eaSimple` as *migrate*.
+
+    Migration is synchronous: an island waits for the migrants of all the
+    islands sending to it.
+
+    :param int island: Index of the island
+    :param list inboxes: Queue of every island
+    :param list targets: Islands the migrants are sent to
+    :param int sources: Number of islands sending migrants to this one
+    :param int interval: Generations between migrations
+    :param int size: Migrants sent to each target
+    :param individual_class: Class of the immigrants, e.g. creator.Individual.
+                             Not used with a BitPopulation.
+    """
+
+    def __init__(self, island, inboxes, targets, sources, interval, size, individual_class):
+        self.island = island
+        self.inboxes = inboxes
+        self.targets = targets
+        self.sources = sources
+        self.interval = interval
+        self.size = size
+        self.individual_class = individual_class
+
+    def __call__(self, population, gen):
+        if gen % self.interval != 0:
+            return
+
+        # Best first
+        scores = np.array([ind.fitness.values[0] * ind.fitness.weights[0] for ind in population])
+        order = np.argsort(-scores, kind="stable")
+
+        emigrants = [
+            (pack_individual(population[i]), population[i].fitness.values)
+            for i in order[: self.size]
+        ]
+        for target in self.targets:
+            self.inboxes[target].put(emigrants)
+
+        immigrants = [
+            immigrant
+            for _ in range(self.sources)
+            for immigrant in self.inboxes[self.island].get()
+        ]
+        for i, (packed, values) in zip(order[::-1], immigrants):
+            self.replace(population, i, packed, values)
+
+    def replace(self, population, i, packed, values):
+        if isinstance(population, BitPopulation):
+            population.bits[i] = np.frombuffer(packed, dtype=np.uint8)
+            population.fitness[i] = values[0]
+        else:
+            individual = self.individual_class(unpack_individual(packed, len(population[i])))
+            individual.fitness.values = values
+            population[i] = individual
+
+
+def run_island(island, evolve, migration, results):
+    # Forked islands start with the same random state
+    random.seed()
+    np.random.seed()
+    bitmatrix.seed(None)
+
+    halloffame, logbook = evolve(migration)
+    results.put((island, halloffame, logbook))
+
+
+def run_islands(
+    islands,
+    evolve,
+    interval,
+    size,
+    topology="ring",
+    individual_class=None,
+):
+    """
+    Runs an island model GA, one process per island. Returns the hall of fame
+    items of every island and the combined logbook, see :func:`combine_logbooks`.
+
+    Islands are forked, so evolve can use the toolbox, statistics and data of
+    the parent process.
+
+    :param int islands: Number of islands
+    :param evolve: Function running the GA of an island and returning its hall
+                   of fame items and logbook, called with the
+                   :class:`Migration` to pass to eaSimple
+    :param int interval: Generations between migrations
+    :param int size: Migrants sent by an island to each neighbour
+    :param str topology: "ring" or "all", see topologies
+    :param individual_class: Class of the immigrants in list populations
+    """
+    context = multiprocessing.get_context("fork")
+    inboxes = [context.Queue() for _ in range(islands)]
+    results = context.Queue()
+    targets = [topologies[topology](island, islands) for island in range(islands)]
+
+    processes = []
+    for island in range(islands):
+        sources = sum(island in targets[other] for other in range(islands))
+        migration = Migration(
+            island, inboxes, targets[island], sources, interval, size, individual_class
+        )
+        processes.append(
+            context.Process(target=run_island, args=(island, evolve, migration, results))
+        )
+    for process in processes:
+        process.start()
+
+    # Collect before joining, the results would not fit in the queue buffer
+    collected = {}
+    while len(collected) < islands:
+        try:
+            island, halloffame, logbook = results.get(timeout=1)
+            collected[island] = (halloffame, logbook)
+        except queue.Empty:
+            if any(process.exitcode not in (None, 0) for process in processes):
+                # The other islands would wait forever for its migrants
+                for process in processes:
+                    process.terminate()
+                raise RuntimeError("An island process failed")
+    for process in processes:
+        process.join()
+
+    halloffames = [collected[island][0] for island in range(islands)]
+    logbook = combine_logbooks([collected[island][1] for island in range(islands)])
+    return halloffames, logbook
+
+
+def combine_logbooks(logbooks):
+    """
+    Combines the logbooks of the islands, generation by generation. Evaluations
+    are summed, the generation time is the slowest island's, and avg, std, min
+    and max are computed over all the islands, assuming equal population sizes.
+    The record of each island is kept in the chapter island_<index>.
+    """
+    combined = tools.Logbook()
+    combined.header = ["gen", "nevals", "time"] + [
+        field for field in ("avg", "std", "min", "max") if field in logbooks[0].header
+    ]
+
+    for records in zip(*logbooks):
+        record = {
+            "gen": records[0]["gen"],
+            "nevals": sum(r["nevals"] for r in records),
+            "time": max(r["time"] for r in records),
+        }
+        if "avg" in records[0]:
+            record["avg"] = float(np.mean([r["avg"] for r in records]))
+        if "std" in records[0]:
+            # Pooled standard deviation of equally sized populations
+            second_moment = np.mean([r["std"] ** 2 + r["avg"] ** 2 for r in records])
+            record["std"] = math.sqrt(max(second_moment - record["avg"] ** 2, 0.0))
+        if "min" in records[0]:
+            record["min"] = min(r["min"] for r in records)
+        if "max" in records[0]:
+            record["max"] = max(r["max"] for r in records)
+        combined.record(**record)
+
+    # Appended, record would copy the combined fields into every chapter
+    for island, logbook in enumerate(logbooks):
+        chapter = combined.chapters[f"island_{island}"]
+        chapter.header = logbook.header
+        chapter.extend(dict(r) for r in logbook[: len(combined)])
+
+    return combined
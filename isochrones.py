@@ -0,0 +1,242 @@
+import asyncio
+import random
+import sqlite3
+import aiohttp
+from shapely import Polygon, from_wkb, to_wkb
+
+# Local openrouteservice endpoint
+ors_url = "http://localhost:8080/ors"
+ors_headers = {
+    "Accept": "application/json, application/geo+json, application/gpx+xml, img/png; charset=utf-8",
+    "Authorization": "5b3ce3597851110001cf62487c1cebfad2324c61823ac5e4fe9be9b1",  # Private
+    "Content-Type": "application/json; charset=utf-8",
+}
+default_profile = "foot-walking"
+
+# Persistent cache of the fetched isochrones
+cache_file = "./data/isochrones.sqlite"
+
+# HTTP statuses worth retrying: rate limited or service unavailable
+retry_statuses = {429, 500, 502, 503, 504}
+
+
+class IsochroneCache:
+    """
+    SQLite cache of isochrone polygons, stored as WKB and keyed by (location, minutes, profile),
+    with their population and the raster it was computed from.
+
+    :param str path: Database file
+    """
+
+    def __init__(self, path=cache_file):
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS isochrones ("
+            "lon REAL, lat REAL, minutes INTEGER, profile TEXT, geometry BLOB, "
+            "population REAL, raster TEXT, "
+            "PRIMARY KEY (lon, lat, minutes, profile))"
+        )
+
+        # Databases written before populations were cached
+        columns = {row[1] for row in self.connection.execute("PRAGMA table_info(isochrones)")}
+        for column, column_type in (("population", "REAL"), ("raster", "TEXT")):
+            if column not in columns:
+                self.connection.execute(f"ALTER TABLE isochrones ADD COLUMN {column} {column_type}")
+
+    def get(self, location, minutes, profile):
+        row = self.connection.execute(
+            "SELECT geometry FROM isochrones WHERE lon = ? AND lat = ? AND minutes = ? AND profile = ?",
+            (location[0], location[1], minutes, profile),
+        ).fetchone()
+        return None if row is None else from_wkb(row[0])
+
+    def get_population(self, location, minutes, profile, raster):
+        row = self.connection.execute(
+            "SELECT population FROM isochrones WHERE lon = ? AND lat = ? AND minutes = ? AND profile = ? "
+            "AND raster = ?",
+            (location[0], location[1], minutes, profile, raster),
+        ).fetchone()
+        return None if row is None else row[0]
+
+    def put_many(self, locations, minutes, profile, isochrones):
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO isochrones (lon, lat, minutes, profile, geometry) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [
+                    (location[0], location[1], minutes, profile, isochrone.wkb)
+                    for location, isochrone in zip(locations, isochrones)
+                ],
+            )
+
+    def put_populations(self, locations, minutes, profile, raster, populations):
+        with self.connection:
+            self.connection.executemany(
+                "UPDATE isochrones SET population = ?, raster = ? "
+                "WHERE lon = ? AND lat = ? AND minutes = ? AND profile = ?",
+                [
+                    (float(population), raster, location[0], location[1], minutes, profile)
+                    for location, population in zip(locations, populations)
+                ],
+            )
+
+    def close(self):
+        self.connection.close()
+
+
+async def fetch_isochrone(session, semaphore, location, minutes, profile, url, retries, backoff):
+    """
+    Requests the isochrone of a location, retrying with exponential backoff
+    when the service fails or is busy
+    """
+    body = {"locations": [location], "range": [minutes * 60]}
+    for attempt in range(retries + 1):
+        try:
+            async with semaphore:
+                async with session.post(f"{url}/v2/isochrones/{profile}", json=body) as response:
+                    if response.status in retry_statuses:
+                        error = RuntimeError(f"HTTP {response.status} for {location}")
+                    elif response.status >= 400:
+                        raise ValueError(
+                            f"HTTP {response.status} for {location}: {await response.text()}"
+                        )
+                    else:
+                        result = await response.json(content_type=None)
+                        return Polygon(result["features"][0]["geometry"]["coordinates"][0])
+        except (aiohttp.ClientError, asyncio.TimeoutError) as exception:
+            error = exception
+        if attempt < retries:
+            await asyncio.sleep(backoff * 2**attempt * (1 + random.random()))
+    raise error
+
+
+async def fetch_isochrones(
+    locations,
+    minutes,
+    profile=default_profile,
+    url=ors_url,
+    concurrency=8,
+    retries=5,
+    backoff=0.5,
+):
+    """
+    Requests the isochrones of the locations concurrently, reusing the connections.
+    Returns the polygons in the order of locations, or the exception of the requests
+    that failed after all their retries.
+
+    :param list locations: Locations in [lon, lat] format
+    :param int minutes: Isochrone range in minutes
+    :param str profile: openrouteservice routing profile
+    :param str url: openrouteservice base URL
+    :param int concurrency: Maximum number of requests in flight
+    :param int retries: Retries of a failed request
+    :param float backoff: Seconds waited before the first retry, doubled on each retry
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(headers=ors_headers, connector=connector) as session:
+        return await asyncio.gather(
+            *[
+                fetch_isochrone(session, semaphore, location, minutes, profile, url, retries, backoff)
+                for location in locations
+            ],
+            return_exceptions=True,
+        )
+
+
+def get_isochrones(
+    locations,
+    minutes,
+    profile=default_profile,
+    cache_path=cache_file,
+    url=ors_url,
+    concurrency=8,
+):
+    """
+    Returns the isochrone polygons of the locations, only requesting the ones
+    missing from the cache and storing them
+
+    :param list locations: Locations in [lon, lat] format
+    :param int minutes: Isochrone range in minutes
+    :param str profile: openrouteservice routing profile
+    :param str cache_path: Cache database file
+    :param str url: openrouteservice base URL
+    :param int concurrency: Maximum number of requests in flight
+    """
+    cache = IsochroneCache(cache_path)
+    try:
+        isochrones = [cache.get(location, minutes, profile) for location in locations]
+        missing = [i for i, isochrone in enumerate(isochrones) if isochrone is None]
+        if missing:
+            missing_locations = [locations[i] for i in missing]
+            fetched = asyncio.run(
+                fetch_isochrones(missing_locations, minutes, profile, url, concurrency)
+            )
+            errors = [isochrone for isochrone in fetched if isinstance(isochrone, Exception)]
+
+            # Keep the fetched isochrones even if some failed, a rerun only requests those
+            fetched_locations = [
+                location
+                for location, isochrone in zip(missing_locations, fetched)
+                if not isinstance(isochrone, Exception)
+            ]
+            cache.put_many(
+                fetched_locations,
+                minutes,
+                profile,
+                [isochrone for isochrone in fetched if not isinstance(isochrone, Exception)],
+            )
+            if errors:
+                raise errors[0]
+
+            for i, isochrone in zip(missing, fetched):
+                isochrones[i] = isochrone
+        return isochrones
+    finally:
+        cache.close()
+
+
+def get_isochrone_populations(
+    locations,
+    minutes,
+    profile=default_profile,
+    cache_path=cache_file,
+    url=ors_url,
+    concurrency=8,
+):
+    """
+    Returns the isochrone polygons of the locations and their populations. Populations
+    missing from the cache are computed in one batch on the full population raster, as
+    isochrones can reach outside the cropped one, and stored with the isochrones.
+
+    :param list locations: Locations in [lon, lat] format
+    :param int minutes: Isochrone range in minutes
+    :param str profile: openrouteservice routing profile
+    :param str cache_path: Cache database file
+    :param str url: openrouteservice base URL
+    :param int concurrency: Maximum number of requests in flight
+    """
+    from data import raster_file
+    from ga_functions import get_raster_context
+
+    isochrones = get_isochrones(locations, minutes, profile, cache_path, url, concurrency)
+
+    cache = IsochroneCache(cache_path)
+    try:
+        populations = [
+            cache.get_population(location, minutes, profile, raster_file)
+            for location in locations
+        ]
+        missing = [i for i, population in enumerate(populations) if population is None]
+        if missing:
+            computed = get_raster_context(raster_file).calculate_populations(
+                to_wkb([isochrones[i] for i in missing]).tolist()
+            )
+            cache.put_populations(
+                [locations[i] for i in missing], minutes, profile, raster_file, computed
+            )
+            for i, population in zip(missing, computed):
+                populations[i] = float(population)
+        return isochrones, populations
+    finally:
+        cache.close()
@@ -1,3 +1,7 @@
+import time
+
+start_time = time.perf_counter()
+
 import random
 import numpy
 
@@ -6,14 +10,201 @@ from deap import creator
 from deap import tools
 from deap import algorithms
 
-from ga_functions import eval_fitness, feasible, max_containers, create_individual_random, create_heuristic_individual
-from utils import write_results, get_solution_coords, voronoi_division
-from data import possible_locations, valencia_region_polygon
+from ga_functions import evaluators, load_evaluator, evaluation_namespace, feasible, max_containers, create_individual_random, create_heuristic_individual, mut_swap, cx_cardinality, repair_offspring, InfeasibleMonitor, get_region_pixels, service_level
+from utils import write_results, get_solution_coords, voronoi_cells
+from data import possible_locations, valencia_region_polygon, individual_size
 import pickle
-import sys
+import argparse
 from custom_deap import eaSimple
+from parallel import EvaluationPool
+from fitness_cache import FitnessCache
+from incremental import local_search
+from islands import run_islands, topologies
+from checkpoint import Checkpoint
+from stopping import stopping_criteria
+from surrogate import CoarseRasterSurrogate, coarsen_pixels
+import profiling
+import bitmatrix
 
-run_id = sys.argv[1]
+parser = argparse.ArgumentParser()
+parser.add_argument("run_id")
+parser.add_argument(
+    "--evaluator",
+    choices=evaluators,
+    default="voronoi",
+    help="Fitness evaluator: clipped Voronoi cells or nearest-site raster pixels",
+)
+parser.add_argument(
+    "--workers",
+    type=int,
+    default=1,
+    help="Evaluation processes, 1 evaluates serially",
+)
+parser.add_argument(
+    "--chunksize",
+    type=int,
+    default=None,
+    help="Individuals sent to a worker at once",
+)
+parser.add_argument(
+    "--threads",
+    type=int,
+    default=1,
+    help="Threads computing the Voronoi cells of one individual (voronoi evaluator)",
+)
+parser.add_argument(
+    "--fitness-cache",
+    type=int,
+    default=0,
+    help="Individuals kept in the fitness cache, 0 disables it",
+)
+parser.add_argument(
+    "--fitness-cache-file",
+    default=None,
+    help="File the fitness cache is loaded from and saved to",
+)
+parser.add_argument(
+    "--local-search",
+    type=int,
+    default=0,
+    help="Swap moves tried on the best individual after the GA, 0 disables it",
+)
+parser.add_argument(
+    "--representation",
+    choices=["list", "bits"],
+    default="list",
+    help="Population as DEAP lists or as a packed bit matrix with vectorized operators",
+)
+parser.add_argument(
+    "--operators",
+    choices=["flip", "swap"],
+    default="flip",
+    help="Uniform crossover and bit flip mutation, or crossover and swap mutation keeping the number of containers",
+)
+parser.add_argument(
+    "--repair",
+    action="store_true",
+    help="Clear random containers of offspring above max_containers",
+)
+parser.add_argument(
+    "--islands",
+    type=int,
+    default=1,
+    help="Populations evolved in parallel processes, exchanging their best individuals",
+)
+parser.add_argument(
+    "--migration-interval",
+    type=int,
+    default=10,
+    help="Generations between migrations (islands)",
+)
+parser.add_argument(
+    "--migration-size",
+    type=int,
+    default=5,
+    help="Individuals sent by an island to each neighbour (islands)",
+)
+parser.add_argument(
+    "--topology",
+    choices=topologies,
+    default="ring",
+    help="Islands an island sends its best individuals to (islands)",
+)
+parser.add_argument(
+    "--checkpoint-every",
+    type=int,
+    default=None,
+    help="Generations between checkpoints of the run",
+)
+parser.add_argument(
+    "--checkpoint-minutes",
+    type=float,
+    default=None,
+    help="Minutes between checkpoints of the run",
+)
+parser.add_argument(
+    "--resume",
+    action="store_true",
+    help="Continue the run from its checkpoint, if there is one",
+)
+parser.add_argument(
+    "--stagnation",
+    type=int,
+    default=None,
+    help="Stop after this many generations without improving the best individual",
+)
+parser.add_argument(
+    "--min-diversity",
+    type=float,
+    default=None,
+    help="Stop when individuals differ on average in fewer genes than this",
+)
+parser.add_argument(
+    "--time-budget",
+    type=float,
+    default=None,
+    help="Stop after this many minutes",
+)
+parser.add_argument(
+    "--evaluation-budget",
+    type=int,
+    default=None,
+    help="Stop after this many evaluations",
+)
+parser.add_argument(
+    "--profile",
+    action="store_true",
+    help="Time the phases of each generation and evaluation, written to the logbook and a profile file",
+)
+parser.add_argument(
+    "--surrogate-fraction",
+    type=float,
+    default=None,
+    help="Fraction of the feasible offspring evaluated exactly, ranked by a surrogate of the fitness",
+)
+parser.add_argument(
+    "--surrogate-cell",
+    type=float,
+    default=0.002,
+    help="Side in degrees of the cells aggregating the raster pixels for the surrogate",
+)
+args = parser.parse_args()
+if args.threads > 1 and args.evaluator != "voronoi":
+    parser.error("--threads is only used by the voronoi evaluator")
+if args.islands > 1 and args.workers > 1:
+    parser.error("--islands already uses one process per island, use --workers 1")
+if args.islands > 1 and (args.checkpoint_every or args.checkpoint_minutes or args.resume):
+    parser.error("checkpoints are not supported with --islands")
+stop_limits = (args.stagnation, args.min_diversity, args.time_budget, args.evaluation_budget)
+if args.islands > 1 and any(limit is not None for limit in stop_limits):
+    # Migration is synchronous, the other islands would wait for a stopped one
+    parser.error("stopping criteria are not supported with --islands")
+if args.islands > 1 and args.profile:
+    parser.error("--profile is not supported with --islands")
+if args.surrogate_fraction is not None:
+    if not 0 < args.surrogate_fraction <= 1:
+        parser.error("--surrogate-fraction must be in (0, 1]")
+    if args.representation == "bits":
+        # Approximate fitnesses are flagged on the individuals
+        parser.error("--surrogate-fraction is not supported with --representation bits")
+    if args.islands > 1:
+        parser.error("--surrogate-fraction is not supported with --islands")
+
+run_id = args.run_id
+checkpoint_file = f"./results/ga_random_{run_id}.checkpoint.npz"
+profile_file = f"./results/ga_random_{run_id}.profile.json"
+if args.profile:
+    # Before the evaluation pool is forked, so the workers profile too
+    profiling.enable()
+eval_fitness = load_evaluator(args.evaluator, args.threads)
+
+fitness_cache = None
+if args.fitness_cache > 0:
+    fitness_cache = FitnessCache(
+        args.fitness_cache,
+        args.fitness_cache_file,
+        evaluation_namespace(args.evaluator),
+    )
 
 
 # --- Parameters ---
@@ -48,34 +239,150 @@ toolbox.register("population", tools.initRepeat, list, toolbox.individual)
 
 # Operators
 toolbox.register("evaluate", eval_fitness)
+if fitness_cache is not None:
+    toolbox.decorate("evaluate", fitness_cache)
 toolbox.decorate("evaluate", tools.DeltaPenality(feasible, not_feasible_penalty))
-toolbox.register("mate", tools.cxUniform, indpb=indpb_mate)
-toolbox.register("mutate", tools.mutFlipBit, indpb=indpb_mutate)
+if args.profile:
+    toolbox.decorate("evaluate", profiling.timed)
+if args.operators == "swap":
+    toolbox.register("mate", cx_cardinality)
+    toolbox.register("mutate", mut_swap, indpb=indpb_mutate)
+else:
+    toolbox.register("mate", tools.cxUniform, indpb=indpb_mate)
+    toolbox.register("mutate", tools.mutFlipBit, indpb=indpb_mutate)
+if args.repair:
+    toolbox.decorate("mate", repair_offspring())
+    toolbox.decorate("mutate", repair_offspring())
 toolbox.register("select", tools.selTournament, tournsize=tournament_size)
 
+if args.representation == "bits":
+    toolbox.register(
+        "population",
+        bitmatrix.random_population,
+        size=individual_size,
+        ones=max_containers,
+        weights=creator.FitnessMin.weights,
+    )
+    toolbox.register("select", bitmatrix.sel_tournament, tournsize=tournament_size)
+    toolbox.register(
+        "vary",
+        bitmatrix.var_and,
+        indpb_mate=indpb_mate,
+        indpb_mutate=indpb_mutate,
+        operators=args.operators,
+        max_ones=max_containers if args.repair else None,
+    )
+
 
 def main(pop_size, cxpb, mutpb, ngen):
-    pop = toolbox.population(n=pop_size)
-    hof = tools.HallOfFame(1)
+    monitors = [InfeasibleMonitor()]
+    if fitness_cache is not None:
+        monitors.append(fitness_cache)
+    if args.profile:
+        monitors.append(profiling.profiler)
+    surrogate = None
+    if args.surrogate_fraction is not None:
+        surrogate = CoarseRasterSurrogate(
+            *coarsen_pixels(*get_region_pixels(), args.surrogate_cell),
+            possible_locations,
+            service_level,
+            args.surrogate_fraction,
+            feasible,
+        )
+        monitors.append(surrogate)
+    pool = None
+    if args.workers > 1:
+        pool = EvaluationPool(
+            args.workers,
+            args.evaluator,
+            not_feasible_penalty,
+            chunksize=args.chunksize,
+            threads=args.threads,
+        )
+        if fitness_cache is not None:
+            toolbox.register("map", fitness_cache.wrap_map(pool.map, feasible))
+        else:
+            toolbox.register("map", pool.map)
+        monitors.append(pool)
+
     stats = tools.Statistics(lambda ind: ind.fitness.values)
     stats.register("avg", numpy.mean)
     stats.register("std", numpy.std)
     stats.register("min", numpy.min)
     stats.register("max", numpy.max)
 
-    pop, log = eaSimple(
-        pop,
-        toolbox,
-        cxpb,
-        mutpb,
-        ngen,
-        stats=stats,
-        halloffame=hof,
-        verbose=True,
-    )
+    checkpoint = None
+    if args.checkpoint_every or args.checkpoint_minutes or args.resume:
+        checkpoint = Checkpoint(
+            checkpoint_file,
+            args.checkpoint_every,
+            args.checkpoint_minutes,
+            creator.Individual,
+        )
+        if args.resume:
+            try:
+                print(f"Resuming after generation {checkpoint.load()}")
+            except FileNotFoundError:
+                print(f"No checkpoint {checkpoint_file}, starting a new run")
+
+    def evolve(migrate=None, verbose=True):
+        pop = toolbox.population(n=pop_size)
+        if args.representation == "bits":
+            hof = bitmatrix.BitHallOfFame(1, creator.Individual)
+        else:
+            hof = tools.HallOfFame(1)
+
+        pop, log = eaSimple(
+            pop,
+            toolbox,
+            cxpb,
+            mutpb,
+            ngen,
+            stats=stats,
+            halloffame=hof,
+            verbose=verbose,
+            monitors=monitors,
+            migrate=migrate,
+            checkpoint=checkpoint,
+            stop=stopping_criteria(*stop_limits),
+            surrogate=surrogate,
+        )
+        return pop, log, hof
+
+    def evolve_island(migration):
+        _, log, hof = evolve(migration, verbose=False)
+        if fitness_cache is not None and fitness_cache.path is not None:
+            # Merged into the file under its lock, with the caches of the other islands
+            fitness_cache.sync()
+        return list(hof.items), log
+
+    print(f"Cold start: {time.perf_counter() - start_time:.3f} s")
+    if args.islands > 1:
+        halloffames, log = run_islands(
+            args.islands,
+            evolve_island,
+            args.migration_interval,
+            args.migration_size,
+            args.topology,
+            creator.Individual,
+        )
+        print(log)
+        pop = None
+        hof = tools.HallOfFame(1)
+        hof.update([ind for items in halloffames for ind in items])
+    else:
+        pop, log, hof = evolve()
+
+    if pool is not None:
+        pool.close()
+    # Islands save their own caches, the one of this process was not used
+    if fitness_cache is not None and fitness_cache.path is not None and args.islands <= 1:
+        fitness_cache.save()
 
     with open(f"./results/ga_random_{run_id}.pickle", "wb") as log_file:
         pickle.dump(log, log_file)
+    if args.profile:
+        profiling.profiler.save(profile_file)
 
     return pop, log, hof
 
@@ -84,11 +391,17 @@ if __name__ == "__main__":
     pop, log, hof = main(pop_size, cxpb, mutpb, ngen)
 
     best_individual = hof.items[0]
-    best_fitness = eval_fitness(hof.items[0])[0]
-
-
+    if args.local_search > 0:
+        improved, _ = local_search(best_individual, args.local_search)
+        improved = creator.Individual(improved)
+        # The search optimizes the raster model, kept only if the selected evaluator agrees
+        improved.fitness.values = toolbox.evaluate(improved)
+        if improved.fitness > best_individual.fitness:
+            best_individual = improved
+    # Cells computed once, for the fitness and the results
     solution_coords = get_solution_coords(best_individual, possible_locations)
-    voronoi_polygons = voronoi_division(solution_coords, valencia_region_polygon)
+    voronoi_polygons = voronoi_cells(solution_coords, valencia_region_polygon)
+    best_fitness = eval_fitness(best_individual, cells=voronoi_polygons)[0]
     write_results(
         f"ga_random_{run_id}",
         best_fitness,
@@ -1,25 +1,122 @@
 import optuna
 import random
 import numpy
+import argparse
 from deap import base, creator, tools, algorithms
 from ga_functions import (
-    eval_fitness,
+    evaluators,
+    load_evaluator,
+    evaluation_namespace,
     feasible,
     distance,
     create_individual_random,
     create_heuristic_individual,
 )
 from custom_deap import eaSimple
+from parallel import EvaluationPool
+from fitness_cache import FitnessCache
+from stopping import stopping_criteria
 
 study_name = "ga-random-init-optimization"
 
+parser = argparse.ArgumentParser()
+parser.add_argument("--evaluator", choices=evaluators, default="voronoi")
+parser.add_argument(
+    "--workers", type=int, default=1, help="Evaluation processes, 1 evaluates serially"
+)
+parser.add_argument("--chunksize", type=int, default=None)
+parser.add_argument(
+    "--threads",
+    type=int,
+    default=1,
+    help="Threads computing the Voronoi cells of one individual (voronoi evaluator)",
+)
+parser.add_argument(
+    "--fitness-cache",
+    type=int,
+    default=0,
+    help="Individuals kept in the fitness cache shared by the trials, 0 disables it",
+)
+parser.add_argument(
+    "--fitness-cache-file",
+    default=None,
+    help="File the fitness cache is loaded from and saved to after each trial",
+)
+parser.add_argument(
+    "--stagnation",
+    type=int,
+    default=None,
+    help="Stop after this many generations without improving the best individual",
+)
+parser.add_argument(
+    "--min-diversity",
+    type=float,
+    default=None,
+    help="Stop when individuals differ on average in fewer genes than this",
+)
+parser.add_argument(
+    "--time-budget",
+    type=float,
+    default=None,
+    help="Stop after this many minutes in each trial",
+)
+parser.add_argument(
+    "--evaluation-budget",
+    type=int,
+    default=None,
+    help="Stop after this many evaluations in each trial",
+)
+parser.add_argument("--trials", type=int, default=600, help="Trials run by this process")
+
+# Fixed params
+not_feasible_penalty = 900000
+
+# Set by setup
+args = None
+eval_fitness = None
+
+# Fitness values shared by every trial
+fitness_cache = None
+
+# Worker processes shared by every trial
+pool = None
+
+
+def setup(options):
+    """
+    Loads the evaluator, with its data and raster, and creates the fitness cache
+    and evaluation pool shared by the trials of this process
+
+    :param options: Arguments parsed by parser
+    """
+    global args, eval_fitness, fitness_cache, pool
+    args = options
+    eval_fitness = load_evaluator(args.evaluator, args.threads)
+
+    if args.fitness_cache > 0:
+        fitness_cache = FitnessCache(
+            args.fitness_cache,
+            args.fitness_cache_file,
+            evaluation_namespace(args.evaluator),
+        )
+
+    if args.workers > 1:
+        pool = EvaluationPool(
+            args.workers,
+            args.evaluator,
+            not_feasible_penalty,
+            distance,
+            chunksize=args.chunksize,
+            threads=args.threads,
+        )
+
+
 creator.create("FitnessMin", base.Fitness, weights=(-1.0,))
 creator.create("Individual", list, fitness=creator.FitnessMin)
 
 
 def objective(trial):
     # --- Fixed params ---
-    not_feasible_penalty = 900000
     ngen = 300  # Number of generations
 
     # --- Optimisation parameters ---
@@ -53,12 +150,20 @@ def objective(trial):
 
     # Operators
     toolbox.register("evaluate", eval_fitness)
+    if fitness_cache is not None:
+        toolbox.decorate("evaluate", fitness_cache)
     toolbox.decorate(
         "evaluate", tools.DeltaPenality(feasible, not_feasible_penalty, distance)
     )
     toolbox.register("mate", tools.cxUniform, indpb=indpb_mate)
     toolbox.register("mutate", tools.mutFlipBit, indpb=indpb_mutate)
     toolbox.register("select", tools.selTournament, tournsize=tournament_size)
+    if pool is not None and fitness_cache is not None:
+        toolbox.register("map", fitness_cache.wrap_map(pool.map, feasible))
+    elif pool is not None:
+        toolbox.register("map", pool.map)
+
+    monitors = [monitor for monitor in (pool, fitness_cache) if monitor is not None]
 
     pop = toolbox.population(n=population_size)
     hof = tools.HallOfFame(1)
@@ -79,6 +184,13 @@ def objective(trial):
         verbose=True,
         trial=trial,
         optuna=optuna,
+        monitors=monitors,
+        stop=stopping_criteria(
+            args.stagnation,
+            args.min_diversity,
+            args.time_budget,
+            args.evaluation_budget,
+        ),
     )
     best_individual = hof.items[0]
     best_fitness = eval_fitness(best_individual)
@@ -91,12 +203,25 @@ def objective(trial):
     return best_fitness
 
 
-# Set up and run the Optuna study
-study = optuna.create_study(
-    direction="minimize",
-    storage="sqlite:///db.sqlite3",  # Specify the storage URL here.
-    study_name=study_name,
-    load_if_exists=True,
-    pruner=optuna.pruners.HyperbandPruner(),
-)
-study.optimize(objective, n_trials=600)
+def save_fitness_cache(study, trial):
+    if fitness_cache is not None and fitness_cache.path is not None:
+        # Merged with the file, other processes of the study may have saved it
+        fitness_cache.sync()
+
+
+if __name__ == "__main__":
+    options = parser.parse_args()
+    if options.threads > 1 and options.evaluator != "voronoi":
+        parser.error("--threads is only used by the voronoi evaluator")
+    setup(options)
+
+    # Set up and run the Optuna study
+    study = optuna.create_study(
+        direction="minimize",
+        storage="sqlite:///db.sqlite3",  # Specify the storage URL here.
+        study_name=study_name,
+        load_if_exists=True,
+        pruner=optuna.pruners.HyperbandPruner(),
+    )
+
+    study.optimize(objective, n_trials=options.trials, callbacks=[save_fitness_cache])
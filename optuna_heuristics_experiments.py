@@ -1,12 +1,17 @@
 import optuna
 import random
 import numpy
+import argparse
 from heuristics import max_population_min_overlap_heuristic
 from data import possible_locations, individual_size
-from ga_functions import max_containers
+from ga_functions import max_containers, evaluators
 
 study_name = "overlap-heuristic"
 
+parser = argparse.ArgumentParser()
+parser.add_argument("--evaluator", choices=evaluators, default="voronoi")
+args = parser.parse_args()
+
 def objective(trial):
 
     # --- Optimisation parameters ---
@@ -15,7 +20,12 @@ def objective(trial):
     minutes = trial.suggest_int("minutes", 5, 10, step=1)
 
     result = max_population_min_overlap_heuristic(
-        possible_locations, individual_size, max_containers, minutes, threshold
+        possible_locations,
+        individual_size,
+        max_containers,
+        minutes,
+        threshold,
+        evaluate=evaluators[args.evaluator],
     )
 
     return result[0]
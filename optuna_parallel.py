@@ -0,0 +1,88 @@
+import multiprocessing
+import os
+import random
+import numpy
+import optuna
+import optuna_experiments as experiments
+
+# Runs the trials of optuna_experiments.py in parallel processes sharing a journal file
+# storage, which takes concurrent writers without the locking errors of SQLite.
+# The input data, raster and fitness cache are loaded once and forked into every process.
+# python optuna_parallel.py --jobs 16 --trials 600 --evaluator raster --fitness-cache 200000 --fitness-cache-file ./results/fitness_cache.pickle
+
+parser = experiments.parser
+parser.add_argument(
+    "--jobs",
+    type=int,
+    default=os.cpu_count(),
+    help="Processes running trials concurrently",
+)
+parser.add_argument(
+    "--journal",
+    default="./optuna_journal.log",
+    help="Journal file storing the study",
+)
+
+
+def get_storage(journal):
+    return optuna.storages.JournalStorage(optuna.storages.journal.JournalFileBackend(journal))
+
+
+def run_trials(journal, trials):
+    # Forked processes start with the same random state
+    random.seed()
+    numpy.random.seed()
+
+    study = optuna.load_study(
+        study_name=experiments.study_name,
+        storage=get_storage(journal),
+        pruner=optuna.pruners.HyperbandPruner(),
+    )
+    study.optimize(
+        experiments.objective,
+        n_trials=trials,
+        callbacks=[experiments.save_fitness_cache],
+    )
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    if args.threads > 1 and args.evaluator != "voronoi":
+        parser.error("--threads is only used by the voronoi evaluator")
+    if args.workers > 1:
+        parser.error("--jobs already runs one process per trial, use --workers 1")
+
+    # Loaded before forking, so the processes share the data
+    experiments.setup(args)
+    if experiments.fitness_cache is not None and experiments.fitness_cache.path is not None:
+        # Refused here rather than after the first trial of every process
+        experiments.fitness_cache.sync()
+
+    optuna.create_study(
+        direction="minimize",
+        storage=get_storage(args.journal),
+        study_name=experiments.study_name,
+        load_if_exists=True,
+        pruner=optuna.pruners.HyperbandPruner(),
+    )
+
+    # Trials split evenly between the processes
+    context = multiprocessing.get_context("fork")
+    processes = [
+        context.Process(
+            target=run_trials,
+            args=(args.journal, args.trials // args.jobs + (job < args.trials % args.jobs)),
+        )
+        for job in range(args.jobs)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+    failed = sum(process.exitcode != 0 for process in processes)
+    if failed:
+        raise SystemExit(f"{failed} of {args.jobs} processes failed")
+
+    study = optuna.load_study(study_name=experiments.study_name, storage=get_storage(args.journal))
+    print(f"Best trial {study.best_trial.number}: {study.best_value} {study.best_params}")
@@ -0,0 +1,89 @@
+import argparse
+import asyncio
+import math
+import random
+from aiohttp import web
+
+# Local stand-in for the openrouteservice isochrones endpoint, to test the isochrone
+# fetcher without the real service. Isochrones are circles walked at walking_speed.
+# python ors_stub.py --port 8080 --failure-rate 0.1
+
+walking_speed = 5000 / 3600  # m/s
+earth_radius = 6371000  # m
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--port", type=int, default=8080)
+parser.add_argument(
+    "--failure-rate",
+    type=float,
+    default=0.0,
+    help="Fraction of requests answered with HTTP 503, to exercise the retries",
+)
+parser.add_argument(
+    "--delay",
+    type=float,
+    default=0.0,
+    help="Seconds waited before each response",
+)
+parser.add_argument(
+    "--vertices",
+    type=int,
+    default=32,
+    help="Vertices of the isochrone polygons",
+)
+
+
+def circle(location, radius, vertices):
+    lon, lat = location
+    dlat = math.degrees(radius / earth_radius)
+    dlon = dlat / math.cos(math.radians(lat))
+    ring = [
+        [
+            lon + dlon * math.cos(2 * math.pi * k / vertices),
+            lat + dlat * math.sin(2 * math.pi * k / vertices),
+        ]
+        for k in range(vertices)
+    ]
+    return ring + [ring[0]]
+
+
+async def isochrones(request):
+    settings = request.app["settings"]
+    request.app["requests"] += 1
+    if settings.delay:
+        await asyncio.sleep(settings.delay)
+    if random.random() < settings.failure_rate:
+        raise web.HTTPServiceUnavailable()
+
+    body = await request.json()
+    features = [
+        {
+            "type": "Feature",
+            "properties": {"group_index": i, "value": seconds, "center": location},
+            "geometry": {
+                "type": "Polygon",
+                "coordinates": [circle(location, seconds * walking_speed, settings.vertices)],
+            },
+        }
+        for i, location in enumerate(body["locations"])
+        for seconds in body["range"]
+    ]
+    return web.json_response({"type": "FeatureCollection", "features": features})
+
+
+async def stats(request):
+    return web.json_response({"requests": request.app["requests"]})
+
+
+def create_app(settings):
+    app = web.Application()
+    app["settings"] = settings
+    app["requests"] = 0
+    app.router.add_post("/ors/v2/isochrones/{profile}", isochrones)
+    app.router.add_get("/stats", stats)
+    return app
+
+
+if __name__ == "__main__":
+    settings = parser.parse_args()
+    web.run_app(create_app(settings), port=settings.port)
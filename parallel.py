@@ -0,0 +1,155 @@
+import math
+import multiprocessing
+import time
+from types import SimpleNamespace
+import numpy as np
+from deap import tools
+import profiling
+
+# Evaluation function of the worker process, set by init_worker
+worker_evaluate = None
+worker_individual_size = None
+
+
+class UnpackedIndividual(list):
+    """
+    Individual rebuilt in a worker. It only carries the fitness weights, which
+    DeltaPenality reads to penalize infeasible individuals.
+    """
+
+    fitness = SimpleNamespace(weights=(-1.0,))
+
+
+def pack_individual(individual):
+    """
+    Packs a binary individual into bytes, 8 genes per byte
+
+    :param list individual: Solution / individual list
+    """
+    return np.packbits(np.asarray(individual, dtype=np.uint8)).tobytes()
+
+
+def unpack_individual(packed, individual_size):
+    """
+    Unpacks an individual packed by pack_individual into a list of 0s and 1s
+
+    :param bytes packed: Packed individual
+    :param int individual_size: Number of genes
+    """
+    return np.unpackbits(np.frombuffer(packed, dtype=np.uint8), count=individual_size).tolist()
+
+
+def init_worker(evaluator, penalty, distance, weights, threads):
+    """
+    Loads the input data, region polygon and raster once per worker process.
+    """
+    global worker_evaluate, worker_individual_size
+    from data import individual_size
+    from ga_functions import load_evaluator, feasible
+
+    UnpackedIndividual.fitness = SimpleNamespace(weights=weights)
+    worker_individual_size = individual_size
+    worker_evaluate = tools.DeltaPenality(feasible, penalty, distance)(
+        load_evaluator(evaluator, threads)
+    )
+
+
+def evaluate_packed(packed):
+    """
+    Evaluates a packed individual in a worker, returning its fitness, evaluation
+    time and, if profiling is enabled, the profile of the evaluation
+    """
+    start_time = time.perf_counter()
+    individual = UnpackedIndividual(unpack_individual(packed, worker_individual_size))
+    fitness = worker_evaluate(individual)
+    elapsed = time.perf_counter() - start_time
+    profile = profiling.profiler.collect() if profiling.profiler is not None else None
+    return fitness, elapsed, profile
+
+
+class EvaluationPool:
+    """
+    Process pool evaluating individuals with the penalized fitness of
+    main.py, ``DeltaPenality(feasible, penalty, distance)(evaluator)``.
+
+    Register :meth:`map` as ``toolbox.map`` and pass the pool to
+    :func:`custom_deap.eaSimple` as a monitor to log the speedup of each
+    generation: the evaluation time summed over workers divided by the wall
+    time of the evaluation.
+
+    :param int processes: Number of worker processes
+    :param str evaluator: Name of the evaluator in ga_functions.evaluators
+    :param float penalty: Fitness of infeasible individuals
+    :param distance: Distance function of DeltaPenality, optional
+    :param int chunksize: Individuals sent to a worker at once, by default
+                          4 chunks per worker
+    :param tuple weights: Fitness weights of the individuals
+    :param int threads: Threads per evaluation in each worker
+    """
+
+    fields = ["speedup"]
+
+    def __init__(
+        self,
+        processes,
+        evaluator,
+        penalty,
+        distance=None,
+        chunksize=None,
+        weights=(-1.0,),
+        threads=1,
+    ):
+        self.processes = processes
+        self.chunksize = chunksize
+        self.pool = multiprocessing.Pool(
+            processes,
+            initializer=init_worker,
+            initargs=(evaluator, penalty, distance, weights, threads),
+        )
+        self.busy_time = 0.0
+        self.wall_time = 0.0
+
+    def map(self, func, individuals):
+        """
+        Drop-in for ``toolbox.map``. *func* is ignored: workers evaluate with
+        the function built by :func:`init_worker`.
+        """
+        individuals = list(individuals)
+        if not individuals:
+            return []
+
+        chunksize = self.chunksize or math.ceil(len(individuals) / (4 * self.processes))
+
+        start_time = time.perf_counter()
+        results = self.pool.map(
+            evaluate_packed,
+            [pack_individual(ind) for ind in individuals],
+            chunksize=chunksize,
+        )
+        self.wall_time += time.perf_counter() - start_time
+        self.busy_time += sum(elapsed for _, elapsed, _ in results)
+
+        # Profiles of the workers, when profiling was enabled before the pool was created
+        if profiling.profiler is not None:
+            for _, elapsed, profile in results:
+                profiling.profiler.add_latency(elapsed)
+                if profile is not None:
+                    profiling.profiler.merge(profile)
+
+        return [fitness for fitness, _, _ in results]
+
+    def record(self, individuals):
+        speedup = self.busy_time / self.wall_time if self.wall_time else 0.0
+        self.busy_time = 0.0
+        self.wall_time = 0.0
+        return {"speedup": speedup}
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -1,22 +1,40 @@
 #include <pybind11/pybind11.h>
 #include <pybind11/stl.h>
+#include <pybind11/numpy.h>
 #include <gdal_priv.h>
 #include <ogr_geometry.h>
 #include <json/json.h>
 #include <vector>
+#include <list>
+#include <memory>
+#include <cstdint>
+#include <mutex>
+#include <atomic>
+#include <unordered_map>
+#include <algorithm>
+#include <cmath>
+#include <stdexcept>
+#include <sstream>
 #include <iostream>
+#include <fstream>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <fcntl.h>
+#include <unistd.h>
 
-// Function to create an OGRPolygon from GeoJSON coordinates
-OGRPolygon* createPolygonFromCoordinates(const Json::Value& coordinates) {
+// Function to create an OGRPolygon from GeoJSON coordinates (exterior ring followed by holes)
+OGRPolygon* createPolygonFromCoordinates(const Json::Value& rings) {
     OGRPolygon* polygon = new OGRPolygon();
-    OGRLinearRing ring;
 
-    for (const auto& coord : coordinates) {
-        ring.addPoint(coord[0].asDouble(), coord[1].asDouble());
-    }
+    for (const auto& coordinates : rings) {
+        OGRLinearRing ring;
+        for (const auto& coord : coordinates) {
+            ring.addPoint(coord[0].asDouble(), coord[1].asDouble());
+        }
 
-    ring.closeRings(); // Ensure the ring is closed
-    polygon->addRing(&ring);
+        ring.closeRings(); // Ensure the ring is closed
+        polygon->addRing(&ring);
+    }
     return polygon;
 }
 
@@ -24,7 +42,7 @@ OGRPolygon* createPolygonFromCoordinates(const Json::Value& coordinates) {
 OGRGeometry* parsePolygonGeoJSON(const Json::Value& root) {
     const Json::Value& coordinates = root["coordinates"];
     if (coordinates.isArray() && coordinates.size() > 0) {
-        return createPolygonFromCoordinates(coordinates[0]);
+        return createPolygonFromCoordinates(coordinates);
     } else {
         std::cerr << "Invalid Polygon coordinates format." << std::endl;
         return nullptr;
@@ -32,23 +50,15 @@ OGRGeometry* parsePolygonGeoJSON(const Json::Value& root) {
 }
 
 // Function to parse a MultiPolygon GeoJSON
-OGRGeometryCollection* parseMultiPolygonGeoJSON(const Json::Value& root) {
-    OGRGeometryCollection* multiPolygon = new OGRGeometryCollection();
+OGRMultiPolygon* parseMultiPolygonGeoJSON(const Json::Value& root) {
+    OGRMultiPolygon* multiPolygon = new OGRMultiPolygon();
     const Json::Value& coordinates = root["coordinates"];
 
     if (coordinates.isArray()) {
         for (const auto& polygonCoordsArray : coordinates) {
             if (polygonCoordsArray.isArray() && polygonCoordsArray.size() > 0) {
-                for (const auto& polygonCoords : polygonCoordsArray) {
-                    if (polygonCoords.isArray()) {
-                        OGRPolygon* polygon = createPolygonFromCoordinates(polygonCoords);
-                        multiPolygon->addGeometry(polygon);
-                    } else {
-                        std::cerr << "Invalid Polygon coordinates format in MultiPolygon." << std::endl;
-                        OGRGeometryFactory::destroyGeometry(multiPolygon);
-                        return nullptr;
-                    }
-                }
+                OGRPolygon* polygon = createPolygonFromCoordinates(polygonCoordsArray);
+                multiPolygon->addGeometryDirectly(polygon);
             } else {
                 std::cerr << "Invalid array format in MultiPolygon coordinates." << std::endl;
                 OGRGeometryFactory::destroyGeometry(multiPolygon);
@@ -86,6 +96,47 @@ OGRGeometry* parseGeoJSON(const std::string& geojson) {
     }
 }
 
+// Function to parse a WKB Polygon or MultiPolygon
+OGRGeometry* parseWKB(const std::string& wkb) {
+    OGRGeometry* geometry = nullptr;
+    if (OGRGeometryFactory::createFromWkb(wkb.data(), nullptr, &geometry, wkb.size()) != OGRERR_NONE) {
+        std::cerr << "Failed to parse WKB." << std::endl;
+        return nullptr;
+    }
+    return geometry;
+}
+
+// Function to create an OGRMultiPolygon from coordinate and offset arrays, using the layout of
+// shapely.to_ragged_array: polygons [firstPolygon, lastPolygon) with rings indexed by polygonOffsets
+OGRMultiPolygon* createMultiPolygonFromArrays(const double* coords, const int64_t* ringOffsets,
+                                              const int64_t* polygonOffsets, int64_t firstPolygon,
+                                              int64_t lastPolygon) {
+    OGRMultiPolygon* multiPolygon = new OGRMultiPolygon();
+
+    for (int64_t p = firstPolygon; p < lastPolygon; p++) {
+        OGRPolygon* polygon = new OGRPolygon();
+        for (int64_t r = polygonOffsets[p]; r < polygonOffsets[p + 1]; r++) {
+            OGRLinearRing ring;
+            for (int64_t k = ringOffsets[r]; k < ringOffsets[r + 1]; k++) {
+                ring.addPoint(coords[2 * k], coords[2 * k + 1]);
+            }
+            ring.closeRings();
+            polygon->addRing(&ring);
+        }
+        multiPolygon->addGeometryDirectly(polygon);
+    }
+
+    return multiPolygon;
+}
+
+// Releases OGR geometries when they go out of scope
+struct GeometryDeleter {
+    void operator()(OGRGeometry* geometry) const {
+        OGRGeometryFactory::destroyGeometry(geometry);
+    }
+};
+typedef std::unique_ptr<OGRGeometry, GeometryDeleter> GeometryPtr;
+
 // Function to get the bounding box of the geometry
 void getBoundingBox(OGRGeometry* geom, double* minX, double* maxX, double* minY, double* maxY) {
     OGREnvelope envelope;
@@ -96,27 +147,298 @@ void getBoundingBox(OGRGeometry* geom, double* minX, double* maxX, double* minY,
     *maxY = envelope.MaxY;
 }
 
-// Function to calculate population inside the geometry
-double calculatePopulation(OGRGeometry* geometry, const std::string& rasterFilePath) {
-    if (geometry == nullptr) {
-        std::cerr << "Invalid geometry." << std::endl;
-        return 0.0;
+// Rings of a polygonal geometry, each one as a flat x0, y0, x1, y1, ... list
+typedef std::vector<std::vector<double>> RingList;
+
+void addRing(const OGRLinearRing* ring, RingList& rings) {
+    if (ring == nullptr || ring->getNumPoints() == 0) {
+        return;
+    }
+
+    std::vector<double> coords;
+    coords.reserve(2 * ring->getNumPoints());
+    for (int k = 0; k < ring->getNumPoints(); k++) {
+        coords.push_back(ring->getX(k));
+        coords.push_back(ring->getY(k));
+    }
+    rings.push_back(coords);
+}
+
+// Function to collect the exterior and interior rings of Polygons and MultiPolygons
+void collectRings(const OGRGeometry* geometry, RingList& rings) {
+    OGRwkbGeometryType type = wkbFlatten(geometry->getGeometryType());
+    if (type == wkbPolygon) {
+        const OGRPolygon* polygon = static_cast<const OGRPolygon*>(geometry);
+        addRing(polygon->getExteriorRing(), rings);
+        for (int k = 0; k < polygon->getNumInteriorRings(); k++) {
+            addRing(polygon->getInteriorRing(k), rings);
+        }
+    } else if (type == wkbMultiPolygon || type == wkbGeometryCollection) {
+        const OGRGeometryCollection* collection = static_cast<const OGRGeometryCollection*>(geometry);
+        for (int k = 0; k < collection->getNumGeometries(); k++) {
+            collectRings(collection->getGeometryRef(k), rings);
+        }
     }
+}
 
+// Function to get the sorted x coordinates where the rings cross the horizontal line y.
+// Returns false if a vertex lies exactly on the line, where the crossing parity is ambiguous.
+bool getScanlineCrossings(const RingList& rings, double y, std::vector<double>& crossings) {
+    crossings.clear();
+    for (const auto& ring : rings) {
+        size_t nPoints = ring.size() / 2;
+        for (size_t k = 0; k < nPoints; k++) {
+            size_t next = (k + 1) % nPoints;
+            double x1 = ring[2 * k], y1 = ring[2 * k + 1];
+            double x2 = ring[2 * next], y2 = ring[2 * next + 1];
+
+            if (y1 == y) {
+                return false;
+            }
+            if ((y1 > y) != (y2 > y)) {
+                crossings.push_back(x1 + (y - y1) * (x2 - x1) / (y2 - y1));
+            }
+        }
+    }
+
+    std::sort(crossings.begin(), crossings.end());
+    return crossings.size() % 2 == 0;
+}
+
+// Raster dataset kept open between calls, with a cache of the blocks already read
+class RasterContext {
+public:
+    RasterContext(const std::string& rasterFilePath, size_t cacheSizeMB)
+        : poDataset(nullptr), poBand(nullptr), mapped(nullptr), mappedBytes(0) {
+        if (rasterFilePath.size() >= 5 && rasterFilePath.compare(rasterFilePath.size() - 5, 5, ".json") == 0) {
+            openCropped(rasterFilePath);
+        } else {
+            openDataset(rasterFilePath);
+        }
+
+        size_t blockBytes = static_cast<size_t>(nBlockXSize) * nBlockYSize * sizeof(int);
+        maxCachedBlocks = std::max<size_t>(1, cacheSizeMB * 1024 * 1024 / blockBytes);
+    }
+
+    ~RasterContext() {
+        if (poDataset != nullptr) {
+            GDALClose((GDALDatasetH)poDataset);
+        }
+        if (mapped != nullptr) {
+            munmap(const_cast<int32_t*>(mapped), mappedBytes);
+        }
+    }
+
+    RasterContext(const RasterContext&) = delete;
+    RasterContext& operator=(const RasterContext&) = delete;
+
+    double calculatePopulation(OGRGeometry* geometry, bool scanline);
+
+    size_t cachedBlocks() {
+        std::lock_guard<std::mutex> lock(cacheMutex);
+        return blockCache.size();
+    }
+
+    // Cumulative counters of the work done, for profiling
+    struct Counters {
+        std::atomic<uint64_t> geometries{0};
+        std::atomic<uint64_t> rows{0};
+        std::atomic<uint64_t> pixels{0};
+        std::atomic<uint64_t> containsTests{0};
+        std::atomic<uint64_t> blockReads{0};
+        std::atomic<uint64_t> blockHits{0};
+    } counters;
+
+private:
+    typedef std::shared_ptr<const std::vector<int>> Block;
+
+    void openDataset(const std::string& rasterFilePath);
+    void openCropped(const std::string& sidecarPath);
+
+    // Pixel of the memory-mapped crop, calculatePopulation checks the window is inside it
+    int mappedValue(int i, int j) const {
+        return mapped[static_cast<size_t>(i - yOffset) * mappedWidth + (j - xOffset)];
+    }
+
+    struct CachedBlock {
+        Block data;
+        std::list<long long>::iterator lruPosition;
+    };
+
+    Block getBlock(int xBlock, int yBlock);
+
+    // Reads the pixels of one raster row, fetching a new block only when j crosses into it.
+    // Holding the block keeps it alive if another thread evicts it from the cache.
+    struct RowReader {
+        RasterContext* context;
+        int i;
+        int yBlock;
+        size_t rowOffset;
+        int currentXBlock;
+        Block block;
+        const int* blockRow;
+
+        RowReader(RasterContext* context, int i)
+            : context(context), i(i), yBlock(i / context->nBlockYSize),
+              rowOffset(static_cast<size_t>(i % context->nBlockYSize) * context->nBlockXSize),
+              currentXBlock(-1), blockRow(nullptr) {}
+
+        int value(int j) {
+            if (context->mapped != nullptr) {
+                return context->mappedValue(i, j);
+            }
+            int xBlock = j / context->nBlockXSize;
+            if (xBlock != currentXBlock) {
+                block = context->getBlock(xBlock, yBlock);
+                blockRow = block->data() + rowOffset;
+                currentXBlock = xBlock;
+            }
+            return blockRow[j - xBlock * context->nBlockXSize];
+        }
+    };
+
+    GDALDataset* poDataset;
+    GDALRasterBand* poBand;
+    int nXSize, nYSize;
+    int nBlockXSize, nBlockYSize, nBlocksPerRow;
+    double adfGeoTransform[6];
+    double noDataValue;
+
+    // Cropped raster mapped in memory instead of the GDAL dataset. Its pixels are indexed like the
+    // source raster, shifted by the offsets of the crop, so results match the source exactly.
+    const int32_t* mapped;
+    size_t mappedBytes;
+    int xOffset, yOffset, mappedWidth, mappedHeight;
+
+    // Least recently used blocks are evicted once maxCachedBlocks is reached.
+    // The mutex guards the cache and the GDAL dataset, which is not thread safe.
+    size_t maxCachedBlocks;
+    std::unordered_map<long long, CachedBlock> blockCache;
+    std::list<long long> lruKeys;
+    std::mutex cacheMutex;
+};
+
+void RasterContext::openDataset(const std::string& rasterFilePath) {
     GDALAllRegister();
-    GDALDataset* poDataset = (GDALDataset*)GDALOpen(rasterFilePath.c_str(), GA_ReadOnly);
+    poDataset = (GDALDataset*)GDALOpen(rasterFilePath.c_str(), GA_ReadOnly);
     if (poDataset == nullptr) {
-        std::cerr << "Failed to open raster file." << std::endl;
-        return 0.0;
+        throw std::runtime_error("Failed to open raster file: " + rasterFilePath);
     }
 
-    GDALRasterBand* poBand = poDataset->GetRasterBand(1);
-    int nXSize = poBand->GetXSize();
-    int nYSize = poBand->GetYSize();
+    poBand = poDataset->GetRasterBand(1);
+    nXSize = poBand->GetXSize();
+    nYSize = poBand->GetYSize();
+    poBand->GetBlockSize(&nBlockXSize, &nBlockYSize);
+    nBlocksPerRow = (nXSize + nBlockXSize - 1) / nBlockXSize;
 
-    double adfGeoTransform[6];
     poDataset->GetGeoTransform(adfGeoTransform);
 
+    // Get NoData value from the raster band
+    noDataValue = poBand->GetNoDataValue();
+}
+
+// Function to map the raw Int32 crop described by a sidecar written by data.compile_cropped_raster.
+// The mapping is shared, so every process reading it uses the same page-cached copy.
+void RasterContext::openCropped(const std::string& sidecarPath) {
+    std::ifstream sidecar(sidecarPath);
+    Json::CharReaderBuilder rbuilder;
+    std::string errs;
+    Json::Value root;
+    if (!sidecar || !Json::parseFromStream(rbuilder, sidecar, &root, &errs)) {
+        throw std::runtime_error("Failed to read raster sidecar: " + sidecarPath);
+    }
+
+    nXSize = root["raster_width"].asInt();
+    nYSize = root["raster_height"].asInt();
+    for (int k = 0; k < 6; k++) {
+        adfGeoTransform[k] = root["geotransform"][k].asDouble();
+    }
+    // NoData pixels are already 0
+    noDataValue = root["nodata"].isNull() ? 0.0 : root["nodata"].asDouble();
+
+    xOffset = root["x_offset"].asInt();
+    yOffset = root["y_offset"].asInt();
+    mappedWidth = root["width"].asInt();
+    mappedHeight = root["height"].asInt();
+
+    // One block per row, unused by the mapped reads
+    nBlockXSize = nXSize;
+    nBlockYSize = 1;
+    nBlocksPerRow = 1;
+
+    std::string directory = sidecarPath.substr(0, sidecarPath.find_last_of('/') + 1);
+    std::string dataPath = directory + root["data"].asString();
+    mappedBytes = static_cast<size_t>(mappedWidth) * mappedHeight * sizeof(int32_t);
+
+    int fd = open(dataPath.c_str(), O_RDONLY);
+    if (fd < 0) {
+        throw std::runtime_error("Failed to open raster data: " + dataPath);
+    }
+    struct stat status;
+    if (fstat(fd, &status) != 0 || static_cast<size_t>(status.st_size) != mappedBytes) {
+        close(fd);
+        throw std::runtime_error("Raster data does not match its sidecar: " + dataPath);
+    }
+    if (mappedBytes == 0) {
+        close(fd);
+        throw std::runtime_error("Raster data is empty: " + dataPath);
+    }
+    void* address = mmap(nullptr, mappedBytes, PROT_READ, MAP_SHARED, fd, 0);
+    close(fd);
+    if (address == MAP_FAILED) {
+        throw std::runtime_error("Failed to map raster data: " + dataPath);
+    }
+    mapped = static_cast<const int32_t*>(address);
+}
+
+// Function to get a raster block as Int32, reading it only on the first access
+RasterContext::Block RasterContext::getBlock(int xBlock, int yBlock) {
+    long long key = static_cast<long long>(yBlock) * nBlocksPerRow + xBlock;
+
+    std::lock_guard<std::mutex> lock(cacheMutex);
+    auto cached = blockCache.find(key);
+    if (cached != blockCache.end()) {
+        counters.blockHits.fetch_add(1, std::memory_order_relaxed);
+        lruKeys.splice(lruKeys.begin(), lruKeys, cached->second.lruPosition);
+        return cached->second.data;
+    }
+
+    if (blockCache.size() >= maxCachedBlocks) {
+        blockCache.erase(lruKeys.back());
+        lruKeys.pop_back();
+    }
+
+    // Edge blocks are partial, but keep the full block stride
+    int xOff = xBlock * nBlockXSize;
+    int yOff = yBlock * nBlockYSize;
+    int width = std::min(nBlockXSize, nXSize - xOff);
+    int height = std::min(nBlockYSize, nYSize - yOff);
+
+    std::shared_ptr<std::vector<int>> data =
+        std::make_shared<std::vector<int>>(static_cast<size_t>(nBlockXSize) * nBlockYSize, 0);
+    CPLErr err = poBand->RasterIO(GF_Read, xOff, yOff, width, height, data->data(), width, height,
+                                  GDT_Int32, 0, static_cast<GSpacing>(nBlockXSize) * sizeof(int));
+    if (err != CE_None) {
+        throw std::runtime_error("Failed to read raster block.");
+    }
+    counters.blockReads.fetch_add(1, std::memory_order_relaxed);
+
+    lruKeys.push_front(key);
+    CachedBlock& block = blockCache[key];
+    block.data = data;
+    block.lruPosition = lruKeys.begin();
+    return block.data;
+}
+
+// Function to calculate population inside the geometry.
+// The scanline fill gives the same pixels as testing every pixel with Contains: pixels on the
+// boundary are excluded, and rows or pixels too close to it to decide are tested with Contains.
+double RasterContext::calculatePopulation(OGRGeometry* geometry, bool scanline) {
+    if (geometry == nullptr) {
+        std::cerr << "Invalid geometry." << std::endl;
+        return 0.0;
+    }
+
     double minX, maxX, minY, maxY;
     getBoundingBox(geometry, &minX, &maxX, &minY, &maxY);
 
@@ -130,49 +452,222 @@ double calculatePopulation(OGRGeometry* geometry, const std::string& rasterFileP
     yStart = std::max(0, yStart);
     yEnd = std::min(nYSize - 1, yEnd);
 
+    // Pixels outside the crop are unknown, not empty
+    if (mapped != nullptr && xStart <= xEnd && yStart <= yEnd &&
+        (xStart < xOffset || yStart < yOffset || xEnd >= xOffset + mappedWidth ||
+         yEnd >= yOffset + mappedHeight)) {
+        throw std::invalid_argument("Geometry extends beyond the cropped raster, use the source raster.");
+    }
+
+    // Scanlines are horizontal only for north-up rasters
+    scanline = scanline && adfGeoTransform[2] == 0.0 && adfGeoTransform[4] == 0.0;
+
+    RingList rings;
+    if (scanline) {
+        collectRings(geometry, rings);
+    }
+
+    // Margin around crossings where the pixel is tested with Contains
+    const double epsilon = 1e-9 * std::max(1.0, std::max(std::fabs(minX), std::fabs(maxX)));
+
     double population = 0.0;
-    std::vector<int> scanline(nXSize);
+    int noData = static_cast<int>(noDataValue);
+    std::vector<double> crossings;
 
-    // Get NoData value from the raster band
-    double noDataValue = poBand->GetNoDataValue();
+    // Counted locally and added once, the atomics are shared by the threads
+    uint64_t pixels = 0, containsTests = 0;
 
     for (int i = yStart; i <= yEnd; i++) {
-        poBand->RasterIO(GF_Read, 0, i, nXSize, 1, scanline.data(), nXSize, 1, GDT_Int32, 0, 0);
+        RowReader row(this, i);
+        double lat = adfGeoTransform[3] + xStart * adfGeoTransform[4] + i * adfGeoTransform[5];
+
+        bool rowScanline = scanline && getScanlineCrossings(rings, lat, crossings);
+        size_t span = 0;
 
         for (int j = xStart; j <= xEnd; j++) {
             double lon = adfGeoTransform[0] + j * adfGeoTransform[1] + i * adfGeoTransform[2];
-            double lat = adfGeoTransform[3] + j * adfGeoTransform[4] + i * adfGeoTransform[5];
+            lat = adfGeoTransform[3] + j * adfGeoTransform[4] + i * adfGeoTransform[5];
+
+            bool inside;
+            if (rowScanline) {
+                // Skip the spans ending before this pixel
+                while (span < crossings.size() && crossings[span + 1] + epsilon < lon) {
+                    span += 2;
+                }
+                if (span >= crossings.size()) {
+                    break; // Past the last span
+                }
+                if (lon + epsilon < crossings[span]) {
+                    continue; // Before the next span
+                }
 
-            OGRPoint point(lon, lat);
-            if (geometry->Contains(&point)) {
-                int pixelValue = scanline[j];
+                if (lon > crossings[span] + epsilon && lon < crossings[span + 1] - epsilon) {
+                    inside = true;
+                } else {
+                    OGRPoint point(lon, lat);
+                    inside = geometry->Contains(&point);
+                    containsTests++;
+                }
+            } else {
+                OGRPoint point(lon, lat);
+                inside = geometry->Contains(&point);
+                containsTests++;
+            }
+
+            if (inside) {
+                pixels++;
+                int pixelValue = row.value(j);
                 // Skip NoData values
-                if (pixelValue != static_cast<int>(noDataValue)) {
+                if (pixelValue != noData) {
                     population += pixelValue;
                 }
             }
         }
     }
 
-    GDALClose((GDALDatasetH)poDataset);
+    counters.geometries.fetch_add(1, std::memory_order_relaxed);
+    counters.rows.fetch_add(std::max(0, yEnd - yStart + 1), std::memory_order_relaxed);
+    counters.pixels.fetch_add(pixels, std::memory_order_relaxed);
+    counters.containsTests.fetch_add(containsTests, std::memory_order_relaxed);
     return population;
 }
 
 // Python binding
 namespace py = pybind11;
 
-double calculate_population_py(const std::string& geojson, const std::string& rasterFilePath) {
-    OGRGeometry* geometry = parseGeoJSON(geojson);
+// Function to map the Python method name to the rasterization path
+bool useScanline(const std::string& method) {
+    if (method == "scanline") {
+        return true;
+    } else if (method == "contains") {
+        return false;
+    }
+    throw std::invalid_argument("Unknown method: " + method + ", expected 'scanline' or 'contains'.");
+}
+
+double calculate_population_context_py(RasterContext& context, const std::string& geojson, const std::string& method) {
+    bool scanline = useScanline(method);
+
+    // Parsing and raster work do not touch Python objects
+    py::gil_scoped_release release;
+
+    GeometryPtr geometry(parseGeoJSON(geojson));
     if (geometry == nullptr) {
         throw std::runtime_error("Failed to parse GeoJSON.");
     }
 
-    double population = calculatePopulation(geometry, rasterFilePath);
-    OGRGeometryFactory::destroyGeometry(geometry);
-    return population;
+    return context.calculatePopulation(geometry.get(), scanline);
+}
+
+double calculate_population_py(const std::string& geojson, const std::string& rasterFilePath) {
+    RasterContext context(rasterFilePath, 64);
+    return calculate_population_context_py(context, geojson, "scanline");
+}
+
+// Batch version taking a list of WKB geometries. Geometries that cannot be parsed get 0 population.
+py::array_t<double> calculate_populations_wkb_py(RasterContext& context, const std::vector<std::string>& wkbs,
+                                                 const std::string& method) {
+    bool scanline = useScanline(method);
+
+    py::array_t<double> populations(wkbs.size());
+    double* result = populations.mutable_data();
+
+    py::gil_scoped_release release;
+    for (size_t k = 0; k < wkbs.size(); k++) {
+        GeometryPtr geometry(parseWKB(wkbs[k]));
+        result[k] = geometry == nullptr ? 0.0 : context.calculatePopulation(geometry.get(), scanline);
+    }
+    return populations;
+}
+
+// Function to check that offsets start at 0 or later, never decrease and end at limit or before,
+// so every range [offsets[k], offsets[k + 1]) indexes into the next level
+bool validOffsets(const int64_t* offsets, py::ssize_t size, int64_t limit) {
+    if (offsets[0] < 0 || offsets[size - 1] > limit) {
+        return false;
+    }
+    for (py::ssize_t k = 1; k < size; k++) {
+        if (offsets[k] < offsets[k - 1]) {
+            return false;
+        }
+    }
+    return true;
+}
+
+// Batch version taking the coordinate and offset arrays of shapely.to_ragged_array for MultiPolygons
+py::array_t<double> calculate_populations_arrays_py(
+    RasterContext& context,
+    py::array_t<double, py::array::c_style | py::array::forcecast> coords,
+    py::array_t<int64_t, py::array::c_style | py::array::forcecast> ringOffsets,
+    py::array_t<int64_t, py::array::c_style | py::array::forcecast> polygonOffsets,
+    py::array_t<int64_t, py::array::c_style | py::array::forcecast> geometryOffsets,
+    const std::string& method) {
+    bool scanline = useScanline(method);
+
+    if (coords.ndim() != 2 || coords.shape(1) != 2) {
+        throw std::invalid_argument("coords must have shape (N, 2).");
+    }
+    if (ringOffsets.ndim() != 1 || polygonOffsets.ndim() != 1 || geometryOffsets.ndim() != 1 ||
+        ringOffsets.size() < 1 || polygonOffsets.size() < 1 || geometryOffsets.size() < 1) {
+        throw std::invalid_argument("Offsets must be non-empty 1-D arrays.");
+    }
+
+    const double* coordsData = coords.data();
+    const int64_t* rings = ringOffsets.data();
+    const int64_t* polygons = polygonOffsets.data();
+    const int64_t* geometries = geometryOffsets.data();
+
+    // Offsets must index into the next level, checked before the GIL is released
+    if (!validOffsets(geometries, geometryOffsets.size(), polygonOffsets.size() - 1) ||
+        !validOffsets(polygons, polygonOffsets.size(), ringOffsets.size() - 1) ||
+        !validOffsets(rings, ringOffsets.size(), coords.shape(0))) {
+        throw std::invalid_argument("Offsets are out of bounds or not monotonic.");
+    }
+
+    size_t nGeometries = geometryOffsets.size() - 1;
+    py::array_t<double> populations(nGeometries);
+    double* result = populations.mutable_data();
+
+    // The input arrays are kept alive by the arguments while the GIL is released
+    py::gil_scoped_release release;
+    for (size_t k = 0; k < nGeometries; k++) {
+        GeometryPtr geometry(createMultiPolygonFromArrays(coordsData, rings, polygons, geometries[k], geometries[k + 1]));
+        result[k] = context.calculatePopulation(geometry.get(), scanline);
+    }
+    return populations;
+}
+
+py::dict counters_py(RasterContext& context) {
+    py::dict counters;
+    counters["geometries"] = context.counters.geometries.load();
+    counters["rows"] = context.counters.rows.load();
+    counters["pixels"] = context.counters.pixels.load();
+    counters["contains_tests"] = context.counters.containsTests.load();
+    counters["block_reads"] = context.counters.blockReads.load();
+    counters["block_hits"] = context.counters.blockHits.load();
+    return counters;
 }
 
 PYBIND11_MODULE(population_calculator, m) {
+    py::class_<RasterContext>(m, "RasterContext")
+        .def(py::init<const std::string&, size_t>(),
+             "Open a population raster, or the .json sidecar of a cropped raw raster, once for repeated calculations",
+             py::arg("rasterFilePath"), py::arg("cacheSizeMB") = 512)
+        .def("calculate_population", &calculate_population_context_py,
+             "Calculate population inside a geometry from GeoJSON", py::arg("geojson"),
+             py::arg("method") = "scanline")
+        .def("calculate_populations", &calculate_populations_wkb_py,
+             "Calculate the population inside each geometry of a list of WKB geometries",
+             py::arg("wkbs"), py::arg("method") = "scanline")
+        .def("calculate_populations", &calculate_populations_arrays_py,
+             "Calculate the population inside each MultiPolygon given as shapely.to_ragged_array arrays",
+             py::arg("coords"), py::arg("ring_offsets"), py::arg("polygon_offsets"), py::arg("geometry_offsets"),
+             py::arg("method") = "scanline")
+        .def_property_readonly("cached_blocks", &RasterContext::cachedBlocks)
+        .def("counters", &counters_py,
+             "Cumulative counts of geometries, raster rows scanned, pixels read, point in polygon tests "
+             "and raster blocks read from the file or found in the cache");
+
     m.def("calculate_population", &calculate_population_py, "Calculate population inside a geometry from GeoJSON",
           py::arg("geojson"), py::arg("rasterFilePath"));
 }
@@ -0,0 +1,185 @@
+import bisect
+import json
+import os
+import time
+from contextlib import nullcontext
+
+# Profiler of the current process, None while profiling is disabled, see enable
+profiler = None
+
+# Functions returning cumulative counters, e.g. RasterContext.counters, by prefix
+counter_sources = {}
+
+# Upper bounds of the evaluation latency histogram buckets, from 0.1 ms doubling up to ~52 s
+latency_bounds = [1e-4 * 2**k for k in range(20)]
+
+disabled_phase = nullcontext()
+
+
+class Phase:
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start_time = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        self.profiler.add_time(self.name, time.perf_counter() - self.start_time)
+
+
+class Profiler:
+    """
+    Accumulates the time spent in each phase of the GA, the latency of each
+    evaluation and counters such as cells per individual or the pixels scanned
+    by the raster context.
+
+    Pass it to :func:`custom_deap.eaSimple` as a monitor: every generation its
+    figures are recorded in the *profile* chapter of the logbook, the time of
+    each phase as <phase>_time, and added to the totals of the run, written
+    by :meth:`save`.
+    """
+
+    # The profile is a logbook chapter, not a column of the stream
+    fields = []
+
+    def __init__(self):
+        self.generations = []
+        self.totals = self.empty()
+        self.current = self.empty()
+        self.source_values = {}
+
+    @staticmethod
+    def empty():
+        return {"phases": {}, "counters": {}, "latency": [0] * (len(latency_bounds) + 1)}
+
+    def add_time(self, name, seconds):
+        phase = self.current["phases"].setdefault(name, [0.0, 0])
+        phase[0] += seconds
+        phase[1] += 1
+
+    def count(self, name, value=1):
+        self.current["counters"][name] = self.current["counters"].get(name, 0) + value
+
+    def add_latency(self, seconds):
+        self.current["latency"][bisect.bisect_left(latency_bounds, seconds)] += 1
+
+    def collect(self):
+        """
+        Returns the figures accumulated since the last call and starts over
+        """
+        for prefix, source in counter_sources.items():
+            values = source()
+            previous = self.source_values.get(prefix, {})
+            for name, value in values.items():
+                self.count(f"{prefix}_{name}", value - previous.get(name, 0))
+            self.source_values[prefix] = values
+
+        collected, self.current = self.current, self.empty()
+        return collected
+
+    def merge(self, collected, into=None):
+        """
+        Adds figures returned by :meth:`collect`, e.g. from a worker process
+        """
+        into = self.current if into is None else into
+        for name, (seconds, calls) in collected["phases"].items():
+            phase = into["phases"].setdefault(name, [0.0, 0])
+            phase[0] += seconds
+            phase[1] += calls
+        for name, value in collected["counters"].items():
+            into["counters"][name] = into["counters"].get(name, 0) + value
+        into["latency"] = [a + b for a, b in zip(into["latency"], collected["latency"])]
+
+    def record(self, individuals):
+        collected = self.collect()
+        self.merge(collected, self.totals)
+        self.generations.append(collected)
+
+        # Flat, nested dicts would become chapters of the chapter
+        record = {f"{name}_time": seconds for name, (seconds, _) in collected["phases"].items()}
+        record.update(collected["counters"])
+        record["evaluations"] = sum(collected["latency"])
+        record["latency"] = list(collected["latency"])
+        return {"profile": record}
+
+    def save(self, path):
+        profile = {
+            "latency_bounds": latency_bounds,
+            "total": summarize(self.totals),
+            "generations": [summarize(collected) for collected in self.generations],
+        }
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(profile, f, indent=1)
+        os.replace(f"{path}.tmp", path)
+
+
+def summarize(collected):
+    """
+    Returns the figures of :meth:`Profiler.collect` as seconds and calls per
+    phase, counters, and the evaluation latency histogram with its count
+    """
+    return {
+        "phases": {
+            name: {"seconds": seconds, "calls": calls}
+            for name, (seconds, calls) in collected["phases"].items()
+        },
+        "counters": dict(collected["counters"]),
+        "evaluations": sum(collected["latency"]),
+        "latency": list(collected["latency"]),
+    }
+
+
+def enable():
+    """
+    Enables profiling in this process and the processes forked from it. Returns the profiler.
+    """
+    global profiler
+    if profiler is None:
+        profiler = Profiler()
+    return profiler
+
+
+def phase(name):
+    """
+    Context manager timing a phase, doing nothing while profiling is disabled
+
+    :param str name: Phase name
+    """
+    if profiler is None:
+        return disabled_phase
+    return Phase(profiler, name)
+
+
+def count(name, value=1):
+    if profiler is not None:
+        profiler.count(name, value)
+
+
+def watch_counters(prefix, source):
+    """
+    Adds the counters returned by source to the profile, as increments between generations
+
+    :param str prefix: Prefix of the counter names
+    :param source: Function returning a dict of cumulative counters
+    """
+    counter_sources[prefix] = source
+    if profiler is not None:
+        # A new source, e.g. reopened in a forked process, starts from its own values
+        profiler.source_values.pop(prefix, None)
+
+
+def timed(func):
+    """
+    Decorator adding the latency of each call to the profile, for toolbox.decorate("evaluate", timed)
+    """
+
+    def wrapper(*args, **kwargs):
+        if profiler is None:
+            return func(*args, **kwargs)
+        start_time = time.perf_counter()
+        result = func(*args, **kwargs)
+        profiler.add_latency(time.perf_counter() - start_time)
+        return result
+
+    return wrapper
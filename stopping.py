@@ -0,0 +1,134 @@
+import time
+import numpy as np
+from bitmatrix import BitPopulation
+
+
+class NoImprovement:
+    """
+    Stops when the best individual of the hall of fame has not improved for *generations* generations
+
+    :param int generations: Generations without improvement
+    """
+
+    def __init__(self, generations):
+        self.generations = generations
+        self.best = None
+        self.improved_gen = 0
+
+    def __call__(self, gen, population, halloffame, logbook):
+        if halloffame is None or len(halloffame) == 0:
+            return None
+        # Weighted values, greater is better
+        best = halloffame[0].fitness.wvalues
+        if self.best is None or best > self.best:
+            self.best = best
+            self.improved_gen = gen
+        if gen - self.improved_gen >= self.generations:
+            return f"no improvement in {self.generations} generations"
+        return None
+
+    def state(self):
+        """
+        Returns the state saved by a checkpoint, restored by :meth:`set_state`
+        """
+        return {
+            "best": None if self.best is None else list(self.best),
+            "improved_gen": self.improved_gen,
+        }
+
+    def set_state(self, state):
+        self.best = None if state["best"] is None else tuple(state["best"])
+        self.improved_gen = state["improved_gen"]
+
+
+def diversity(population):
+    """
+    Returns the mean Hamming distance between two individuals of the population,
+    computed from the frequency of each gene
+    """
+    if isinstance(population, BitPopulation):
+        frequencies = population.genes().mean(axis=0)
+    else:
+        frequencies = np.asarray(population, dtype=np.uint8).mean(axis=0)
+    return float(np.sum(2 * frequencies * (1 - frequencies)))
+
+
+class LowDiversity:
+    """
+    Stops when the individuals differ on average in fewer than *threshold* genes, see :func:`diversity`
+
+    :param float threshold: Mean Hamming distance
+    """
+
+    def __init__(self, threshold):
+        self.threshold = threshold
+
+    def __call__(self, gen, population, halloffame, logbook):
+        value = diversity(population)
+        if value < self.threshold:
+            return f"diversity {value:.1f} below {self.threshold}"
+        return None
+
+
+class TimeBudget:
+    """
+    Stops when *minutes* minutes have passed since it was created
+
+    :param float minutes: Wall-clock budget
+    """
+
+    def __init__(self, minutes):
+        self.minutes = minutes
+        self.start_time = time.time()
+
+    def __call__(self, gen, population, halloffame, logbook):
+        if time.time() - self.start_time >= self.minutes * 60:
+            return f"time budget of {self.minutes} minutes"
+        return None
+
+    def state(self):
+        """
+        Returns the state saved by a checkpoint, restored by :meth:`set_state`.
+        The time between the checkpoint and the resume is not counted.
+        """
+        return {"elapsed": time.time() - self.start_time}
+
+    def set_state(self, state):
+        self.start_time = time.time() - state["elapsed"]
+
+
+class EvaluationBudget:
+    """
+    Stops when the logbook counts at least *evaluations* evaluations
+
+    :param int evaluations: Evaluation budget
+    """
+
+    def __init__(self, evaluations):
+        self.evaluations = evaluations
+
+    def __call__(self, gen, population, halloffame, logbook):
+        if sum(logbook.select("nevals")) >= self.evaluations:
+            return f"evaluation budget of {self.evaluations}"
+        return None
+
+
+def stopping_criteria(stagnation=None, diversity=None, minutes=None, evaluations=None):
+    """
+    Returns the criteria of the given limits, to pass to :func:`custom_deap.eaSimple` as *stop*
+
+    :param int stagnation: Generations without improvement, optional
+    :param float diversity: Minimum mean Hamming distance, optional
+    :param float minutes: Wall-clock budget, optional
+    :param int evaluations: Evaluation budget, optional
+    """
+    criteria = []
+    if stagnation is not None:
+        criteria.append(NoImprovement(stagnation))
+    if diversity is not None:
+        criteria.append(LowDiversity(diversity))
+    if minutes is not None:
+        criteria.append(TimeBudget(minutes))
+    if evaluations is not None:
+        criteria.append(EvaluationBudget(evaluations))
+    return criteria
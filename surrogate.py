@@ -0,0 +1,167 @@
+import math
+from collections import deque
+import numpy as np
+from scipy.stats import spearmanr
+from utils import get_solution_coords, nearest_site_populations
+
+
+def coarsen_pixels(pixel_coords, pixel_population, cell_size):
+    """
+    Aggregates populated pixels into square cells, each one located at the
+    population-weighted centroid of its pixels. Returns their coords and population.
+
+    :param ndarray pixel_coords: Pixel coords in [lon, lat] format
+    :param ndarray pixel_population: Pixel population
+    :param float cell_size: Cell side in degrees
+    """
+    keys = np.floor(pixel_coords / cell_size).astype(np.int64)
+    _, cells = np.unique(keys, axis=0, return_inverse=True)
+    cells = cells.ravel()
+    population = np.bincount(cells, pixel_population)
+    coords = np.column_stack(
+        (
+            np.bincount(cells, pixel_population * pixel_coords[:, 0]) / population,
+            np.bincount(cells, pixel_population * pixel_coords[:, 1]) / population,
+        )
+    )
+    return coords, population
+
+
+class CoarseRasterSurrogate:
+    """
+    Surrogate of the fitness screening the offspring, so only the most
+    promising fraction of them gets the exact evaluation. Pass it to
+    :func:`custom_deap.eaSimple` as *surrogate* and as a monitor.
+
+    An individual is scored like the raster evaluator on coarsened pixels,
+    see :func:`coarsen_pixels`, and the score is mapped to the fitness by a
+    linear fit to the last *capacity* exactly evaluated feasible individuals,
+    updated every generation.
+
+    Offspring that are not evaluated get the predicted fitness and the
+    attribute ``approximate`` set to True. They stay out of the hall of fame
+    and the statistics, see :meth:`exact`, and are evaluated exactly if they
+    survive selection. Infeasible offspring are always evaluated, they only
+    get the penalty.
+
+    The logbook records the Spearman correlation between the predicted and
+    exact fitness of the evaluated offspring, and the evaluations saved.
+
+    :param ndarray pixel_coords: Coords of the coarsened pixels
+    :param ndarray pixel_population: Population of the coarsened pixels
+    :param list possible_locations: Locations in [lon, lat] format
+    :param float service_level: Service level of the fitness
+    :param float fraction: Fraction of the feasible offspring evaluated exactly
+    :param feasible: Feasibility check of the penalty, e.g. ga_functions.feasible
+    :param int capacity: Individuals kept to fit the score to the fitness
+    :param int min_samples: Exact evaluations needed before screening
+    """
+
+    fields = ["surrogate_rho", "surrogate_saved"]
+
+    def __init__(
+        self,
+        pixel_coords,
+        pixel_population,
+        possible_locations,
+        service_level,
+        fraction=0.5,
+        feasible=None,
+        capacity=2000,
+        min_samples=50,
+    ):
+        self.pixel_coords = pixel_coords
+        self.pixel_population = pixel_population
+        self.possible_locations = possible_locations
+        self.service_level = service_level
+        self.fraction = fraction
+        self.feasible = feasible
+        self.samples = deque(maxlen=capacity)
+        self.min_samples = min_samples
+        self.slope = None
+        self.intercept = 0.0
+        self.scores = {}
+        self.predictions = {}
+        self.saved = 0
+
+    def score(self, individual):
+        populations = nearest_site_populations(
+            self.pixel_coords,
+            self.pixel_population,
+            get_solution_coords(individual, self.possible_locations),
+        )
+        return float(np.maximum(populations - self.service_level, 0).sum())
+
+    def screen(self, offspring):
+        """
+        Assigns the predicted fitness to the least promising offspring with an invalid
+        fitness and returns the ones to evaluate exactly. Approximate individuals that
+        survived selection unchanged are always evaluated, so a predicted fitness
+        lasts one generation at most.
+        """
+        survivors = []
+        for ind in offspring:
+            if getattr(ind, "approximate", False) and ind.fitness.valid:
+                del ind.fitness.values
+                survivors.append(ind)
+            ind.approximate = False
+        survivor_ids = {id(ind) for ind in survivors}
+        individuals = [
+            ind for ind in offspring if not ind.fitness.valid and id(ind) not in survivor_ids
+        ]
+
+        candidates = [
+            ind for ind in individuals if self.feasible is None or self.feasible(ind)
+        ]
+        self.scores = {id(ind): self.score(ind) for ind in candidates}
+        if self.slope is None or not candidates:
+            return survivors + individuals
+
+        predicted = self.slope * np.array([self.scores[id(ind)] for ind in candidates]) + self.intercept
+
+        # Best first, by weighted fitness
+        order = np.argsort(-predicted * candidates[0].fitness.weights[0], kind="stable")
+        evaluated = math.ceil(self.fraction * len(candidates))
+        for i in order[evaluated:]:
+            candidates[i].fitness.values = (float(predicted[i]),)
+            candidates[i].approximate = True
+        for i in order[:evaluated]:
+            self.predictions[id(candidates[i])] = predicted[i]
+
+        self.saved += len(candidates) - evaluated
+        return survivors + [ind for ind in individuals if not ind.approximate]
+
+    def update(self, individuals):
+        """
+        Adds the exactly evaluated feasible individuals to the samples and refits the score to the fitness
+        """
+        for ind in individuals:
+            if self.feasible is None or self.feasible(ind):
+                score = self.scores.get(id(ind))
+                if score is None:
+                    score = self.score(ind)
+                self.samples.append((score, ind.fitness.values[0]))
+        self.scores = {}
+        if len(self.samples) < self.min_samples:
+            return
+
+        scores, targets = np.array(self.samples).T
+        slope, intercept = np.polyfit(scores, targets, 1)
+        # Degenerate samples, e.g. all with the same score, keep the previous fit
+        if np.isfinite(slope) and np.isfinite(intercept):
+            self.slope, self.intercept = slope, intercept
+
+    def exact(self, individuals):
+        """
+        Returns the individuals whose fitness was evaluated exactly
+        """
+        return [ind for ind in individuals if not getattr(ind, "approximate", False)]
+
+    def record(self, individuals):
+        predicted = [self.predictions[id(ind)] for ind in individuals if id(ind) in self.predictions]
+        exact = [ind.fitness.values[0] for ind in individuals if id(ind) in self.predictions]
+        rho = spearmanr(predicted, exact).statistic if len(predicted) > 2 else float("nan")
+        record = {"surrogate_rho": float(rho), "surrogate_saved": self.saved}
+        self.predictions = {}
+        self.saved = 0
+        return record
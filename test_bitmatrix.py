@@ -0,0 +1,34 @@
+import numpy as np
+from deap import base, creator, tools
+from bitmatrix import BitPopulation, BitHallOfFame
+
+if not hasattr(creator, "FitnessMaxBits"):
+    creator.create("FitnessMaxBits", base.Fitness, weights=(1.0,))
+    creator.create("Bits", list, fitness=creator.FitnessMaxBits)
+
+
+def test_halloffame_skips_duplicates():
+    genes = [
+        [1, 1, 0, 0],
+        [1, 1, 0, 0],
+        [1, 1, 0, 0],
+        [1, 0, 1, 0],
+        [0, 0, 1, 1],
+        [0, 1, 0, 0],
+    ]
+    fitness = [9.0, 9.0, 9.0, 7.0, 5.0, 3.0]
+    individuals = [creator.Bits(g) for g in genes]
+    for individual, value in zip(individuals, fitness):
+        individual.fitness.values = (value,)
+
+    expected = tools.HallOfFame(3, similar=np.array_equal)
+    expected.update(individuals)
+    halloffame = BitHallOfFame(3, creator.Bits)
+    halloffame.update(BitPopulation.from_individuals(individuals, (1.0,)))
+
+    assert [list(ind) for ind in halloffame] == [list(ind) for ind in expected]
+    assert [ind.fitness.values for ind in halloffame] == [(9.0,), (7.0,), (5.0,)]
+
+    # Already kept individuals are not added again
+    halloffame.update(BitPopulation.from_individuals(individuals, (1.0,)))
+    assert [ind.fitness.values for ind in halloffame] == [(9.0,), (7.0,), (5.0,)]
@@ -0,0 +1,58 @@
+import random
+from deap import base, creator, tools
+from checkpoint import Checkpoint
+from custom_deap import eaSimple
+from stopping import EvaluationBudget
+
+if not hasattr(creator, "FitnessOneMax"):
+    creator.create("FitnessOneMax", base.Fitness, weights=(1.0,))
+    creator.create("OneMax", list, fitness=creator.FitnessOneMax)
+
+
+def onemax_toolbox():
+    toolbox = base.Toolbox()
+    toolbox.register("evaluate", lambda individual: (float(sum(individual)),))
+    toolbox.register("mate", tools.cxTwoPoint)
+    toolbox.register("mutate", tools.mutFlipBit, indpb=0.05)
+    toolbox.register("select", tools.selTournament, tournsize=3)
+    return toolbox
+
+
+def onemax_population(size=20, genes=32):
+    return [creator.OneMax(random.randint(0, 1) for _ in range(genes)) for _ in range(size)]
+
+
+def test_resume_after_stop(tmp_path):
+    random.seed(0)
+    path = str(tmp_path / "checkpoint.npz")
+    toolbox = onemax_toolbox()
+    stop = [EvaluationBudget(40)]
+    _, logbook = eaSimple(
+        onemax_population(),
+        toolbox,
+        0.5,
+        0.2,
+        10,
+        halloffame=tools.HallOfFame(1),
+        verbose=False,
+        checkpoint=Checkpoint(path, generations=5, individual_class=creator.OneMax),
+        stop=stop,
+    )
+    stopped_gen = logbook[-1]["gen"]
+    assert "stop" in logbook[-1] and stopped_gen < 5
+
+    checkpoint = Checkpoint(path, generations=5, individual_class=creator.OneMax)
+    assert checkpoint.load() == stopped_gen
+    _, resumed = eaSimple(
+        onemax_population(),
+        toolbox,
+        0.5,
+        0.2,
+        10,
+        halloffame=tools.HallOfFame(1),
+        verbose=False,
+        checkpoint=checkpoint,
+        stop=stop,
+    )
+    assert resumed.select("gen") == logbook.select("gen")
+    assert sum("stop" in record for record in resumed) == 1
@@ -0,0 +1,24 @@
+from deap import tools
+from islands import combine_logbooks
+
+
+def island_logbook(nevals, avg):
+    logbook = tools.Logbook()
+    logbook.header = ["gen", "nevals", "time", "avg", "std", "min", "max"]
+    for gen in range(3):
+        logbook.record(
+            gen=gen, nevals=nevals, time=1.0, avg=avg + gen, std=0.0, min=avg, max=avg + gen
+        )
+    return logbook
+
+
+def test_combine_logbooks_keeps_island_records():
+    logbooks = [island_logbook(10, 1.0), island_logbook(20, 5.0)]
+    combined = combine_logbooks(logbooks)
+
+    assert combined.select("nevals") == [30, 30, 30]
+    assert combined.select("avg") == [3.0, 4.0, 5.0]
+    for island, logbook in enumerate(logbooks):
+        chapter = combined.chapters[f"island_{island}"]
+        assert chapter.select("nevals") == logbook.select("nevals")
+        assert chapter.select("avg") == logbook.select("avg")
@@ -1,39 +1,31 @@
 import json
+import os
+import re
+import numpy as np
 import rasterio
-from rasterio.mask import mask
-from shapely.geometry import Point, LineString, Polygon, MultiPoint
-from shapely import to_geojson, voronoi_polygons, intersection
-from pyproj import Geod
-import requests
+from rasterio.windows import Window
+from scipy.spatial import cKDTree
+from shapely.geometry import Point, LineString, MultiPoint
+from shapely import (
+    to_geojson,
+    voronoi_polygons,
+    intersection,
+    contains_properly,
+    get_parts,
+    prepare,
+    contains_xy,
+    get_type_id,
+    is_empty,
+    to_ragged_array,
+    GeometryType,
+)
+from pyproj import Geod, Transformer
+import profiling
 
 geod = Geod(ellps="WGS84")
 
-# #Load population raster
-# pop_raster_path = "./data/spain_pop.tif"
-# pop_raster = rasterio.open(pop_raster_path)
-
-
-# def get_population_from_polygon(polygon):
-#     """
-#     Returns number of people in a polygon
-
-#     :param json polygon: Polygon in geoJSON format.
-#     """
-#     try:
-#             polygon = json.loads(polygon)
-#             # Mask raster by the polygon and crop it
-#             #polygon = json.loads(polygon)
-#             out_image, out_transform = mask(pop_raster, [polygon], crop=True)
-
-#             # Clean negative values
-#             out_image = out_image[out_image >= 0]
-
-#             # Get total population
-#             total_pop = int(out_image.sum())
-
-#             return total_pop
-#     except ValueError as error:
-#         return {"error": error}
+# Whitespace and commas between the elements of a JSON array
+json_separators = re.compile(r"[\s,]*")
 
 
 def get_distance_between_points(point_a, point_b):
@@ -54,21 +46,122 @@ def remove_similar_locations(locations, threshold=10):
     """
     Remove locations that are within a given distance threshold (in meters).
 
+    Locations are kept in order when they are farther than threshold from all the kept ones.
+    The kept locations are hashed in a grid of azimuthal equidistant coordinates, so the
+    geodesic distance is only computed to those in the neighbouring grid cells.
+
     :param list locations: Locations in [lon, lat] format
     :param int threshold: Distance threshold in meters
     """
-    unique_locations = []
+    if len(locations) == 0:
+        return []
+
+    coords = np.asarray(locations, dtype=np.float64)
+    lon_0, lat_0 = coords.mean(axis=0)
+    transformer = Transformer.from_crs(
+        "EPSG:4326",
+        f"+proj=aeqd +lat_0={lat_0} +lon_0={lon_0} +datum=WGS84 +units=m",
+        always_xy=True,
+    )
+    x, y = transformer.transform(coords[:, 0], coords[:, 1])
 
-    for loc in locations:
-        if all(
-            get_distance_between_points(loc, unique_loc) > threshold
-            for unique_loc in unique_locations
-        ):
-            unique_locations.append(loc)
+    # Cells twice the threshold, so the distortion of the projection can not hide a close pair
+    cell_size = max(2 * threshold, 1)
+    cell_x = np.floor(x / cell_size).astype(np.int64).tolist()
+    cell_y = np.floor(y / cell_size).astype(np.int64).tolist()
+
+    grid = {}
+    unique_locations = []
+    for i, loc in enumerate(locations):
+        nearby = [
+            j
+            for dx in (-1, 0, 1)
+            for dy in (-1, 0, 1)
+            for j in grid.get((cell_x[i] + dx, cell_y[i] + dy), ())
+        ]
+        if nearby:
+            _, _, distances = geod.inv(
+                np.full(len(nearby), coords[i, 0]),
+                np.full(len(nearby), coords[i, 1]),
+                coords[nearby, 0],
+                coords[nearby, 1],
+            )
+            if not np.all(distances > threshold):
+                continue
+
+        grid.setdefault((cell_x[i], cell_y[i]), []).append(i)
+        unique_locations.append(loc)
 
     return unique_locations
 
 
+def iter_json_array(path, block_size=1 << 20):
+    """
+    Yields the elements of a file holding a JSON array of objects, reading it in blocks
+    instead of loading the whole file
+
+    :param str path: JSON file
+    :param int block_size: Characters read at once
+    """
+    decoder = json.JSONDecoder()
+    with open(path) as f:
+        buffer = f.read(block_size).lstrip()
+        if not buffer.startswith("["):
+            raise ValueError(f"{path} does not hold a JSON array")
+        position = 1
+
+        while True:
+            position = json_separators.match(buffer, position).end()
+            if position == len(buffer):
+                block = f.read(block_size)
+                if not block:
+                    raise ValueError(f"{path}: unterminated JSON array")
+                buffer, position = block, 0
+                continue
+            if buffer[position] == "]":
+                return
+
+            try:
+                element, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                # Element split between blocks
+                block = f.read(block_size)
+                if not block:
+                    raise
+                buffer, position = buffer[position:] + block, 0
+                continue
+            yield element
+
+
+def read_container_locations(path, chunk_size=100000):
+    """
+    Yields the [lon, lat] locations of a containers JSON file as float64 arrays of at
+    most chunk_size rows
+
+    :param str path: JSON array of containers with a geo_point_2d field
+    :param int chunk_size: Containers per array
+    """
+    chunk = []
+    for container in iter_json_array(path):
+        chunk.append((container["geo_point_2d"]["lon"], container["geo_point_2d"]["lat"]))
+        if len(chunk) == chunk_size:
+            yield np.array(chunk, dtype=np.float64)
+            chunk = []
+    if chunk:
+        yield np.array(chunk, dtype=np.float64)
+
+
+def filter_locations_in_region(locations, bound_polygon):
+    """
+    Returns the locations inside bound_polygon
+
+    :param ndarray locations: Locations in [lon, lat] format, shape (n, 2)
+    :param Polygon bound_polygon: Region polygon, prepared on first use
+    """
+    prepare(bound_polygon)
+    return locations[contains_xy(bound_polygon, locations[:, 0], locations[:, 1])]
+
+
 def get_solution_coords(solution_vector, possible_locations):
     """
     Converts solution representation into a list of [long,lat] locations
@@ -76,11 +169,8 @@ def get_solution_coords(solution_vector, possible_locations):
     :param list solution_vector: Solution / individual list
     :param list possible_locations: Locations in [lon, lat] format
     """
-    points = []
-    for i, location in enumerate(possible_locations):
-        if solution_vector[i] == 1:
-            points.append(location)
-    return points
+    selected = np.flatnonzero(np.asarray(solution_vector) == 1)
+    return [possible_locations[i] for i in selected]
 
 
 def get_isochrone(location, minutes):
@@ -90,27 +180,9 @@ def get_isochrone(location, minutes):
     :param list location: Location in [lon, lat] format
     :param int minutes: Isochrone range in minutes
     """
-    try:
-        # Calc isochrones
-        isochrone_range = [minutes * 60]
-
-        headers = {
-            "Accept": "application/json, application/geo+json, application/gpx+xml, img/png; charset=utf-8",
-            "Authorization": "5b3ce3597851110001cf62487c1cebfad2324c61823ac5e4fe9be9b1",  # Private
-            "Content-Type": "application/json; charset=utf-8",
-        }
-
-        body = {"locations": [location], "range": isochrone_range}
-        call = requests.post(
-            " http://localhost:8080/ors/v2/isochrones/foot-walking",
-            json=body,
-            headers=headers,
-        )
-        result = call.json()
+    from isochrones import get_isochrones
 
-        return Polygon(result["features"][0]["geometry"]["coordinates"][0])
-    except ValueError as error:
-        return {"error": error}
+    return get_isochrones([location], minutes)[0]
 
 
 def generate_isochrones(possible_locations, isochrone_range):
@@ -120,10 +192,13 @@ def generate_isochrones(possible_locations, isochrone_range):
     :param list possible_locations: Locations in [lon, lat] format
     :param int minutes: Isochrone range in minutes
     """
+    from isochrones import get_isochrone_populations
+
+    # Requested and computed in batches, or read from the isochrone cache
+    isochrones, populations = get_isochrone_populations(possible_locations, isochrone_range)
+
     points_and_pop = []
-    for i, location in enumerate(possible_locations):
-        isochrone = get_isochrone(location, isochrone_range)
-        population = get_population_from_polygon(to_geojson(isochrone))
+    for i, (isochrone, population) in enumerate(zip(isochrones, populations)):
         points_and_pop.append(
             {"index": i, "population": population, "isochrone": isochrone}
         )
@@ -135,21 +210,186 @@ def generate_isochrones(possible_locations, isochrone_range):
     return points_and_pop
 
 
-def voronoi_division(points, bound_polygon):
+def voronoi_cells(points, bound_polygon):
+    """
+    Returns the Voronoi cells of the points intersected with bound_polygon, as an array of
+    shapely geometries. Cells strictly inside the region are kept as they are, only the
+    ones crossing its boundary are clipped.
+
+    :param list points: Points in [lon, lat] format
+    :param Polygon bound_polygon: Region polygon, prepared on first use
+    """
     # Generate voronoi polygons
-    voronoi = voronoi_polygons(MultiPoint(points), extend_to=bound_polygon)
+    with profiling.phase("voronoi"):
+        cells = get_parts(voronoi_polygons(MultiPoint(points), extend_to=bound_polygon))
+        cells = cells[~is_empty(cells)]
+
+    # Intersect the cells crossing the Valencia region boundary
+    with profiling.phase("clip"):
+        prepare(bound_polygon)
+        crossing = ~contains_properly(bound_polygon, cells)
+        cells[crossing] = intersection(cells[crossing], bound_polygon)
 
-    # Intersect generated polygons with Valencia region
-    voronoi_intersected = []
-    for polygon in voronoi.geoms:
-        if not polygon.is_empty:
-            intersect = intersection(polygon, bound_polygon)
-            voronoi_intersected.append(to_geojson(intersect))
+    return cells
 
-    return voronoi_intersected
+
+def voronoi_division(points, bound_polygon):
+    return to_geojson(voronoi_cells(points, bound_polygon)).tolist()
+
+
+def cells_to_ragged_arrays(cells):
+    """
+    Returns the coordinate and offset arrays of the polygonal cells in MultiPolygon layout,
+    as taken by RasterContext.calculate_populations. Empty and non polygonal cells are skipped,
+    they have no population.
+
+    :param list cells: Polygons and MultiPolygons
+    """
+    cells = np.asarray(cells, dtype=object)
+    type_ids = get_type_id(cells)
+    polygonal = (type_ids == GeometryType.POLYGON) | (type_ids == GeometryType.MULTIPOLYGON)
+    cells = cells[polygonal & ~is_empty(cells)]
+
+    if len(cells) == 0:
+        no_offsets = np.zeros(1, dtype=np.int64)
+        return np.empty((0, 2)), no_offsets, no_offsets, no_offsets
+
+    geometry_type, coords, offsets = to_ragged_array(cells)
+    if geometry_type == GeometryType.POLYGON:
+        # One polygon per geometry
+        ring_offsets, polygon_offsets = offsets
+        geometry_offsets = np.arange(len(polygon_offsets), dtype=np.int64)
+    else:
+        ring_offsets, polygon_offsets, geometry_offsets = offsets
+
+    return coords, ring_offsets, polygon_offsets, geometry_offsets
+
+
+def pixel_window(gt, width, height, bounds):
+    """
+    Returns the first and last column and row of the raster pixels in the bounds,
+    with the same arithmetic as population_calculator
+
+    :param list gt: GDAL geotransform of the raster
+    :param int width: Raster width
+    :param int height: Raster height
+    :param tuple bounds: min_x, min_y, max_x, max_y
+    """
+    min_x, min_y, max_x, max_y = bounds
+    x_start = max(0, int((min_x - gt[0]) / gt[1]))
+    x_end = min(width - 1, int((max_x - gt[0]) / gt[1]))
+    y_start = max(0, int((max_y - gt[3]) / gt[5]))
+    y_end = min(height - 1, int((min_y - gt[3]) / gt[5]))
+    return x_start, y_start, x_end, y_end
+
+
+class CroppedRaster:
+    """
+    Raster cropped by data.compile_cropped_raster, memory-mapped. Pixels are
+    indexed like in the source raster.
+
+    :param str path: JSON sidecar of the cropped raster
+    """
+
+    def __init__(self, path):
+        with open(path) as f:
+            sidecar = json.load(f)
+        self.gt = sidecar["geotransform"]
+        self.width = sidecar["raster_width"]
+        self.height = sidecar["raster_height"]
+        self.x_offset = sidecar["x_offset"]
+        self.y_offset = sidecar["y_offset"]
+        self.values = np.memmap(
+            os.path.join(os.path.dirname(path), sidecar["data"]),
+            dtype="<i4",
+            mode="r",
+            shape=(sidecar["height"], sidecar["width"]),
+        )
+
+    def read(self, x_start, y_start, x_end, y_end):
+        """
+        Returns the pixels of columns x_start to x_end and rows y_start to y_end,
+        which must be inside the crop
+        """
+        rows, cols = self.values.shape
+        if (
+            x_start < self.x_offset
+            or y_start < self.y_offset
+            or x_end >= self.x_offset + cols
+            or y_end >= self.y_offset + rows
+        ):
+            raise ValueError("Window extends beyond the cropped raster, use the source raster")
+        return np.array(
+            self.values[
+                y_start - self.y_offset : y_end - self.y_offset + 1,
+                x_start - self.x_offset : x_end - self.x_offset + 1,
+            ]
+        )
+
+
+def load_region_pixels(raster_file, bound_polygon):
+    """
+    Returns the coords and population of the populated raster pixels inside a polygon.
+
+    Each pixel is located by its upper-left corner, the same point the
+    population_calculator extension tests against the Voronoi cells, so both
+    evaluators assign every pixel to the same site.
+
+    :param str raster_file: Path to the population raster, or the sidecar of a cropped raster
+    :param Polygon bound_polygon: Region polygon
+    """
+    if raster_file.endswith(".json"):
+        raster = CroppedRaster(raster_file)
+        gt = raster.gt
+        x_start, y_start, x_end, y_end = pixel_window(
+            gt, raster.width, raster.height, bound_polygon.bounds
+        )
+        values = raster.read(x_start, y_start, x_end, y_end)
+        no_data = 0
+    else:
+        with rasterio.open(raster_file) as raster:
+            gt = raster.transform.to_gdal()
+            x_start, y_start, x_end, y_end = pixel_window(
+                gt, raster.width, raster.height, bound_polygon.bounds
+            )
+            window = Window(x_start, y_start, x_end - x_start + 1, y_end - y_start + 1)
+            values = raster.read(1, window=window, out_dtype="int32")
+            no_data = raster.nodata if raster.nodata is not None else 0
+
+    # Skip NoData and empty pixels
+    rows, cols = np.nonzero((values != int(no_data)) & (values != 0))
+    population = values[rows, cols].astype(np.float64)
+    i = rows + y_start
+    j = cols + x_start
+    lon = gt[0] + j * gt[1] + i * gt[2]
+    lat = gt[3] + j * gt[4] + i * gt[5]
+
+    # Keep pixels inside the region
+    inside = contains_xy(bound_polygon, lon, lat)
+    return np.column_stack((lon[inside], lat[inside])), population[inside]
+
+
+def nearest_site_populations(pixel_coords, pixel_population, points):
+    """
+    Returns the population of each point's Voronoi cell, assigning every pixel to its nearest point.
+
+    :param ndarray pixel_coords: Pixel coords in [lon, lat] format
+    :param ndarray pixel_population: Population of each pixel
+    :param list points: Points in [lon, lat] format
+    """
+    _, nearest = cKDTree(points).query(pixel_coords)
+    return np.bincount(nearest, weights=pixel_population, minlength=len(points))
 
 
 def write_results(name, fitness, solution, solution_coords, voronoi_polygons):
+    """
+    Writes a solution to ./results/<name>.json
+
+    :param list voronoi_polygons: Voronoi cells of the solution as shapely geometries,
+                                  e.g. from voronoi_cells. They are written as GeoJSON strings.
+    """
+    voronoi_polygons = to_geojson(np.asarray(voronoi_polygons, dtype=object)).tolist()
+
     # Convert and write to json file
     with open("./results/" + name + ".json", "w") as outfile:
         json.dump(